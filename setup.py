@@ -9,6 +9,7 @@ REQUIRED_PACKAGES = [
 ]
 
 TEST_REQUIRED_PACKAGES = [
+    'aiohttp',
     'responses',
     'pytest'
 ]
@@ -17,7 +18,11 @@ setup(
     name='sidekick',
     version='0.2.1',
     install_requires=REQUIRED_PACKAGES,
-    extras_require={'test': TEST_REQUIRED_PACKAGES},
+    extras_require={
+        'test': TEST_REQUIRED_PACKAGES,
+        'parquet': ['pyarrow'],
+        'async': ['aiohttp'],
+    },
     packages=find_packages(include='sidekick.*'),
     description='Sidekick for the Peltarion platform',
     author='Peltarion',
@@ -1,20 +1,77 @@
-import pkg_resources
-
-from . import deployment, encode
-from .dataset import create_dataset, process_image
-from .dataset_client import DatasetClient
-from .deployment import Deployment
+import importlib
+import sys
+from typing import Any, List
 
 __all__ = [
     'Deployment',
+    'DeploymentEnsemble',
+    'DeploymentGroup',
     'DatasetClient',
+    'FileSpecCache',
+    'MemorySpecCache',
+    'PredictionCoalescer',
+    'RateLimiter',
     'create_dataset',
     'deployment',
     'encode',
-    'process_image'
+    'process_image',
+    'score_file'
 ]
 
-try:
-    __version__ = pkg_resources.get_distribution('sidekick').version
-except pkg_resources.DistributionNotFound:
-    __version__ = '0.0.0-local'
+# Attributes are imported from their module on first access, so that e.g.
+# using only Deployment does not import pandas
+_ATTRIBUTE_MODULES = {
+    'Deployment': '.deployment',
+    'DeploymentEnsemble': '.ensemble',
+    'DeploymentGroup': '.group',
+    'DatasetClient': '.dataset_client',
+    'FileSpecCache': '.spec_cache',
+    'MemorySpecCache': '.spec_cache',
+    'PredictionCoalescer': '.coalescer',
+    'RateLimiter': '.ratelimit',
+    'create_dataset': '.dataset',
+    'process_image': '.dataset',
+    'score_file': '.scoring',
+}
+_SUBMODULES = {'deployment', 'encode'}
+
+
+def _version() -> str:
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution('sidekick').version
+        except pkg_resources.DistributionNotFound:
+            return '0.0.0-local'
+    try:
+        return metadata.version('sidekick')
+    except metadata.PackageNotFoundError:
+        return '0.0.0-local'
+
+
+def __getattr__(name: str) -> Any:
+    if name == '__version__':
+        value = _version()  # type: Any
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    elif name in _ATTRIBUTE_MODULES:
+        module = importlib.import_module(_ATTRIBUTE_MODULES[name], __name__)
+        value = getattr(module, name)
+    else:
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__) | {'__version__'})
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ is only supported from Python 3.7
+    for _name in __all__ + ['__version__']:
+        __getattr__(_name)
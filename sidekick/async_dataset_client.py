@@ -0,0 +1,175 @@
+import asyncio
+from pathlib import Path
+from typing import Dict, List
+
+from .dataset_client import DatasetClient, Status, UploadJob
+
+try:
+    import aiohttp
+except ImportError:
+    raise ImportError('AsyncDatasetClient requires aiohttp, install it '
+                      'with: pip install sidekick[async]')
+
+
+class AsyncDatasetClient:
+    """Asyncio client for the Dataset API.
+
+    Uploads files like `DatasetClient.upload_data`, without blocking the
+    event loop. Files are streamed from disk, several at a time, and their
+    status is polled while the remaining files are uploaded.
+
+    Args:
+        url: Url of the Dataset API.
+        token: API token.
+        max_workers: Number of files uploaded concurrently.
+
+    """
+
+    _MIN_POLL_INTERVAL = DatasetClient._MIN_POLL_INTERVAL
+    _MAX_POLL_INTERVAL = DatasetClient._MAX_POLL_INTERVAL
+    _EXTENSION_MAPPING = DatasetClient._EXTENSION_MAPPING
+
+    def __init__(self, url: str, token: str, max_workers: int = 10) -> None:
+        self.url = url.rstrip('/')
+        self.max_workers = max_workers
+        self._headers = {
+            'Authorization': 'Bearer %s' % token,
+            'User-Agent': 'sidekick',
+        }
+
+    async def upload_data(
+        self,
+        filepaths: List[str],
+        name: str = 'Sidekick upload',
+        description: str = 'Sidekick upload',
+    ) -> None:
+        """Creates a dataset and uploads files to it.
+
+        Args:
+            filepaths: List of files to upload to the dataset.
+            name: Name of the dataset.
+            description: Description of the dataset.
+
+        Raises:
+            FileNotFoundError: One or more filepaths not found.
+            ValueError: One or more files have a non supported extension.
+            IOError: Error occurred while saving files in dataset.
+
+        """
+        paths = [Path(str(path)).resolve() for path in filepaths]
+        DatasetClient._validate_paths(paths)
+        paths.sort(key=lambda path: path.stat().st_size, reverse=True)
+
+        async with aiohttp.ClientSession(
+                headers=self._headers, raise_for_status=True) as session:
+            wrapper_id = await self._create_wrapper(
+                session, name, description)
+            semaphore = asyncio.Semaphore(self.max_workers)
+            uploads = dict()  # type: Dict[asyncio.Future, Path]
+            for path in paths:
+                task = asyncio.ensure_future(self._stage_file(
+                    session, path, wrapper_id, semaphore))
+                uploads[task] = path
+            try:
+                await self._wait_until_completed(session, wrapper_id, uploads)
+            finally:
+                for upload in uploads:
+                    upload.cancel()
+                # Let cancelled uploads close their files before the session
+                await asyncio.gather(*uploads, return_exceptions=True)
+            await self._complete_upload(session, wrapper_id)
+
+    async def _create_wrapper(
+        self, session: aiohttp.ClientSession, name: str, description: str,
+    ) -> str:
+        async with session.post(
+            self.url, json={'name': name, 'description': description},
+        ) as response:
+            return (await response.json())['datasetWrapperId']
+
+    async def _get_status(
+        self, session: aiohttp.ClientSession, wrapper_id: str,
+    ) -> List[UploadJob]:
+        async with session.get(
+            self.url + '/%s/uploads' % wrapper_id,
+        ) as response:
+            jobs = (await response.json())['uploadStatuses']
+        return [UploadJob.from_dict(job) for job in jobs]
+
+    async def _complete_upload(
+        self, session: aiohttp.ClientSession, wrapper_id: str,
+    ) -> None:
+        async with session.post(
+            self.url + '/%s/upload_complete' % wrapper_id,
+            headers={'Content-Type': 'application/json'},
+        ):
+            pass
+
+    async def _stage_file(
+        self,
+        session: aiohttp.ClientSession,
+        filepath: Path,
+        wrapper_id: str,
+        semaphore: asyncio.Semaphore,
+    ) -> str:
+        content_type = self._EXTENSION_MAPPING[filepath.suffix]
+        async with semaphore:
+            # aiohttp streams file objects in chunks, reading them in a
+            # thread so the event loop is not blocked by disk reads
+            with filepath.open('rb') as file:
+                async with session.post(
+                    self.url + '/%s/upload' % wrapper_id,
+                    headers={'Content-Type': content_type},
+                    data=file,
+                ) as response:
+                    return (await response.json())['uploadId']
+
+    async def _wait_until_completed(
+        self,
+        session: aiohttp.ClientSession,
+        wrapper_id: str,
+        uploads: Dict[asyncio.Future, Path],
+    ) -> None:
+        """Waits until all files are uploaded and saved.
+
+        See `DatasetClient._wait_until_completed`.
+
+        """
+        loop = asyncio.get_event_loop()
+        staging = set(uploads)
+        processing = dict()  # type: Dict[str, Path]
+        interval = self._MIN_POLL_INTERVAL
+        next_poll = 0.0
+
+        while staging or processing:
+            now = loop.time()
+            if staging and (not processing or now < next_poll):
+                idle = not processing
+                done, staging = await asyncio.wait(
+                    staging,
+                    timeout=None if idle else next_poll - now,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    processing[task.result()] = uploads[task]
+                if idle:
+                    next_poll = loop.time() + interval
+                continue
+
+            await asyncio.sleep(max(next_poll - now, 0))
+            saved = 0
+            for job in await self._get_status(session, wrapper_id):
+                path = processing.get(job.id)
+                if path is None or job.status is Status.PROCESSING:
+                    continue
+                if job.status is Status.FAILED:
+                    raise IOError(
+                        'Error saving file: %s, message: %s' % (
+                            path, job.message
+                        )
+                    )
+                del processing[job.id]
+                saved += 1
+            interval = self._MIN_POLL_INTERVAL if saved else min(
+                interval * 2, self._MAX_POLL_INTERVAL)
+            next_poll = loop.time() + interval
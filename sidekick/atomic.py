@@ -0,0 +1,20 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+
+def write_json(path: Path, data: Any) -> None:
+    """Atomically replaces the file at `path` with `data` as JSON
+
+    The temporary file is removed if writing it fails.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=str(path.parent))
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp_path, str(path))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
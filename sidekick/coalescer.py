@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from .deployment import Deployment
+from .encode import DataItem
+
+_Pending = Tuple[dict, Future]
+
+
+class PredictionCoalescer:
+    """Coalesces concurrent single item predictions into batches
+
+    Calls to `predict` from many threads are collected for at most `window`
+    seconds, or until `max_batch_size` items are waiting, and sent to the
+    deployment as a single request. Each caller blocks until the prediction
+    for its own item is available.
+
+    Items are encoded and validated in the calling thread, so a malformed item
+    raises in its caller without affecting the rest of the batch.
+
+    Args:
+        deployment: Deployment to send the coalesced batches to
+        window: Maximum time in seconds to wait for a batch to fill up
+        max_batch_size: Maximum number of items in a batch, defaults to the
+                        `BATCH_SIZE` of the deployment
+        concurrency: Number of batches allowed in flight at the same time
+    """
+
+    def __init__(self,
+                 deployment: Deployment,
+                 window: float = 0.01,
+                 max_batch_size: Optional[int] = None,
+                 concurrency: int = 1) -> None:
+        if window < 0:
+            raise ValueError('Window must be non-negative, got: %s' % window)
+        if concurrency < 1:
+            raise ValueError('Concurrency must be at least 1, got: %s'
+                             % concurrency)
+        self._deployment = deployment
+        self._window = window
+        self._max_batch_size = max_batch_size or deployment.BATCH_SIZE
+        self._concurrency = concurrency
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._lock = threading.Lock()
+        self._workers = []  # type: List[threading.Thread]
+        self._closed = False
+
+    def predict(self, **item) -> DataItem:
+        """Predicts a single item, batched together with concurrent calls"""
+        return self.submit(item).result()
+
+    def submit(self, item: DataItem) -> Future:
+        """Queues an item for prediction and returns a future of the result"""
+        encoded = self._deployment._encode_batch([item])
+        future = Future()  # type: Future
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Coalescer is closed')
+            if not self._workers:
+                self._start_workers()
+            self._queue.put((encoded['rows'][0], future))
+        return future
+
+    def close(self) -> None:
+        """Sends all queued items and stops the background workers"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in self._workers:
+                self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self) -> 'PredictionCoalescer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _start_workers(self) -> None:
+        for _ in range(self._concurrency):
+            worker = threading.Thread(target=self._run, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, running = self._collect(first)
+            self._send(batch)
+
+    def _collect(self, first: _Pending) -> Tuple[List[_Pending], bool]:
+        """Collects queued items until the window closes or batch is full"""
+        batch = [first]
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    pending = self._queue.get(timeout=timeout)
+                else:
+                    pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                return batch, False
+            batch.append(pending)
+        return batch, True
+
+    def _send(self, batch: List[_Pending]) -> None:
+        # Items whose future was cancelled by the caller are not sent, the
+        # others can no longer be cancelled
+        batch = [
+            (row, future) for row, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+        rows = [row for row, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            predictions = self._deployment._predict_encoded({'rows': rows})
+            if len(predictions) != len(futures):
+                raise ValueError('Expected %i predictions, got: %i'
+                                 % (len(futures), len(predictions)))
+        except Exception as exception:
+            for future in futures:
+                self._resolve(future, exception=exception)
+            return
+        for future, prediction in zip(futures, predictions):
+            self._resolve(future, prediction)
+
+    @staticmethod
+    def _resolve(future: Future,
+                 prediction: Optional[DataItem] = None,
+                 exception: Optional[BaseException] = None) -> None:
+        """Sets the outcome of a future without failing the worker"""
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(prediction)
+        except Exception:
+            # The future was resolved elsewhere, the worker must keep
+            # serving the remaining callers
+            pass
@@ -0,0 +1,156 @@
+from typing import Any, Dict, List, Mapping, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .data_models import FeatureSpec
+from .encode import FeaturePlan, NumericEncoder, NumpyEncoder, get_encoder
+
+Columns = Union[pd.DataFrame, Mapping[str, Any]]
+
+_NUMERIC_KINDS = frozenset('biuf')
+
+
+def num_rows(data: Columns) -> int:
+    """Returns the number of rows of a DataFrame or dict of columns"""
+    if isinstance(data, pd.DataFrame):
+        return len(data)
+    lengths = {name: len(column) for name, column in data.items()}
+    if len(set(lengths.values())) > 1:
+        raise ValueError('Columns have different lengths: %s' % lengths)
+    return next(iter(lengths.values()), 0)
+
+
+def slice_rows(data: Columns, start: int, stop: int) -> Columns:
+    if isinstance(data, pd.DataFrame):
+        return data.iloc[start:stop]
+    return {name: column[start:stop] for name, column in data.items()}
+
+
+def encode_columns(data: Columns,
+                   feature_specs: List[FeatureSpec]) -> List[Dict[str, Any]]:
+    """Encodes columnar data to prediction request rows
+
+    Each column is validated and encoded as a whole, numeric columns are
+    converted in a single vectorized step.
+
+    Args:
+        data: DataFrame or dict of equally long columns, e.g. numpy arrays
+              stacked along the first axis
+        feature_specs: Specifications of the features to encode
+
+    Returns:
+        Encoded rows
+    """
+    names = [feature_spec.name for feature_spec in feature_specs]
+    missing = [name for name in names if name not in data]
+    if missing:
+        raise ValueError('Data is missing features: %s' % missing)
+
+    columns = [
+        encode_column(data[feature_spec.name], feature_spec)
+        for feature_spec in feature_specs
+    ]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def encode_column(column: Any, feature_spec: FeatureSpec) -> List[Any]:
+    encoder = get_encoder(feature_spec.dtype, feature_spec.shape)
+
+    if isinstance(encoder, NumericEncoder):
+        array = np.asarray(column)
+        if array.dtype.kind not in _NUMERIC_KINDS:
+            raise TypeError('Expected numeric column %s but received %s'
+                            % (feature_spec.name, array.dtype))
+        return array.reshape(len(array)).tolist()
+
+    if isinstance(encoder, NumpyEncoder):
+        array = _stack(column)
+        if array.shape[1:] != tuple(feature_spec.shape):
+            raise ValueError(
+                'Expected shape: %s, column %s has shape: %s'
+                % (feature_spec.shape, feature_spec.name, array.shape[1:]))
+        return [encoder.encode_json(value) for value in array]
+
+    return FeaturePlan(feature_spec).encode_many(list(column))
+
+
+def decode_columns(rows: Sequence[Mapping[str, Any]],
+                   feature_specs: List[FeatureSpec]) -> Dict[str, np.ndarray]:
+    """Decodes prediction response rows to stacked arrays
+
+    Numeric features become numeric arrays, numpy features are stacked along
+    a new first axis and all other features become object arrays.
+    """
+    columns = dict()
+    for feature_spec in feature_specs:
+        try:
+            values = [row[feature_spec.name] for row in rows]
+        except KeyError:
+            raise ValueError('Item is missing feature: %s' % feature_spec.name)
+        columns[feature_spec.name] = decode_column(values, feature_spec)
+    return columns
+
+
+def decode_column(values: List[Any], feature_spec: FeatureSpec) -> np.ndarray:
+    encoder = get_encoder(feature_spec.dtype, feature_spec.shape)
+
+    if isinstance(encoder, NumericEncoder):
+        array = np.asarray(values)
+        if len(values) and array.dtype.kind not in _NUMERIC_KINDS:
+            raise TypeError('Expected numeric column %s but received %s'
+                            % (feature_spec.name, array.dtype))
+        return array
+
+    if isinstance(encoder, NumpyEncoder):
+        shape = (len(values),) + tuple(feature_spec.shape)
+        if not values:
+            return np.empty(shape, dtype=np.float32)
+        array = np.stack([encoder.decode_json(value) for value in values])
+        if array.shape != shape:
+            raise ValueError('Expected shape: %s, predictions have shape: %s'
+                             % (shape, array.shape))
+        return array
+
+    return _object_array(FeaturePlan(feature_spec).decode_many(values))
+
+
+def concatenate_columns(chunks: List[Dict[str, np.ndarray]],
+                        feature_specs: List[FeatureSpec]) \
+        -> Dict[str, np.ndarray]:
+    return {
+        feature_spec.name: np.concatenate(
+            [chunk[feature_spec.name] for chunk in chunks])
+        for feature_spec in feature_specs
+    }
+
+
+def to_frame(columns: Dict[str, np.ndarray], index: pd.Index) -> pd.DataFrame:
+    """Creates a DataFrame, multidimensional arrays become object columns"""
+    frame = dict()
+    for name, array in columns.items():
+        if array.ndim > 1:
+            array = _object_array(list(array))
+        frame[name] = array
+    return pd.DataFrame(frame, index=index)
+
+
+def _object_array(values: List[Any]) -> np.ndarray:
+    """Creates a 1-d object array without numpy converting the values"""
+    array = np.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        array[index] = value
+    return array
+
+
+def _stack(column: Any) -> np.ndarray:
+    if isinstance(column, np.ndarray) and column.dtype != object:
+        return column
+    if not len(column):
+        return np.empty((0,))
+    values = list(column)
+    for value_type in set(map(type, values)):
+        if not issubclass(value_type, np.ndarray):
+            raise TypeError('Expected %s but received %s'
+                            % (np.ndarray, value_type))
+    return np.stack(values)
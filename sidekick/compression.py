@@ -0,0 +1,12 @@
+import zlib
+from typing import Iterable, Iterator
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+    """Compresses a stream of chunks to a gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
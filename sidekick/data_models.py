@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import Any, Dict, Tuple
 
 
 class FeatureSpec:
@@ -12,3 +12,26 @@ class FeatureSpec:
             'FeatureSpec(name="%s", dtype="%s", shape=%s)'
             % (self.name, self.dtype, self.shape)
         )
+
+    def __eq__(self, other):
+        if not isinstance(other, FeatureSpec):
+            return NotImplemented
+        return (
+            self.name == other.name and
+            self.dtype == other.dtype and
+            tuple(self.shape) == tuple(other.shape)
+        )
+
+    def __hash__(self):
+        return hash((self.name, self.dtype, tuple(self.shape)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'dtype': self.dtype, 'shape': self.shape}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FeatureSpec':
+        return cls(
+            name=data['name'],
+            dtype=data['dtype'],
+            shape=tuple(data['shape']),
+        )
@@ -1,13 +1,28 @@
+import functools
+import io
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List
+from typing import (IO, TYPE_CHECKING, Any, Callable, Dict, Iterator, List,
+                    Optional)
 
 import requests
 from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
+from .compression import gzip_chunks
+from .manifest import UploadManifest
+from .metrics import UploadStats
+from .multipart import (DEFAULT_PART_SIZE, UploadState, content_md5,
+                        part_ranges, read_part)
+from .ratelimit import TokenBucket
+
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 class Status(Enum):
     PROCESSING = 1
@@ -32,19 +47,111 @@ class UploadJob:
         )
 
 
+class _UploadReader:
+    """Request body reading a file in blocks, optionally throttled
+
+    Requests sends file-like bodies block by block and takes the
+    Content-Length from `len`. `on_read` is called with the size of each
+    block read.
+    """
+
+    def __init__(
+        self, file: IO[bytes], size: int,
+        bandwidth: Optional[TokenBucket] = None,
+        on_read: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        self._file = file
+        self._remaining = size
+        self._bandwidth = bandwidth
+        self._on_read = on_read
+
+    def __len__(self) -> int:
+        return self._remaining
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        if self._bandwidth is not None and data:
+            self._bandwidth.acquire(len(data))
+        if self._on_read is not None and data:
+            self._on_read(len(data))
+        return data
+
+
+def _gzip_body(
+    file: IO[bytes], level: int,
+    bandwidth: Optional[TokenBucket] = None,
+    on_read: Optional[Callable[[int], None]] = None,
+    block_size: int = 2 ** 18,
+) -> Iterator[bytes]:
+    """Request body compressing a file with gzip while it is sent
+
+    Requests sends generator bodies with chunked transfer encoding, so the
+    compressed size need not be known up front. `on_read` is called with
+    the size of each uncompressed block and bandwidth is taken per
+    compressed chunk.
+    """
+    def blocks() -> Iterator[bytes]:
+        block = file.read(block_size)
+        while block:
+            if on_read is not None:
+                on_read(len(block))
+            yield block
+            block = file.read(block_size)
+
+    for chunk in gzip_chunks(blocks(), level):
+        if bandwidth is not None and chunk:
+            bandwidth.acquire(len(chunk))
+        yield chunk
+
+
 class DatasetClient:
-    """Client for the Dataset API."""
+    """Client for the Dataset API.
+
+    Args:
+        url: Url of the Dataset API.
+        token: API token.
+        part_size: Files larger than this many bytes are uploaded in parts
+            of this size, None uploads every file in a single request.
+        part_workers: Number of parts of a file uploaded concurrently.
+        max_workers: Number of files uploaded concurrently.
+        max_bytes_per_second: Cap on the combined upload bandwidth.
+        compress_level: Gzip level from 0 to 9 used to compress csv and
+            npy files while they are uploaded, None uploads them as is.
+
+    """
 
     _MAX_RETRIES = 3
+    _MIN_POLL_INTERVAL = 0.25
+    _MAX_POLL_INTERVAL = 10.0
     _EXTENSION_MAPPING = {
         '.csv': 'text/csv',
         '.zip': 'application/zip',
         '.npy': 'application/npy',
     }
     VALID_EXTENSIONS = set(_EXTENSION_MAPPING.keys())
+    _COMPRESSIBLE_EXTENSIONS = {'.csv', '.npy'}
 
-    def __init__(self, url: str, token: str) -> None:
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        part_size: Optional[int] = None,
+        part_workers: int = 4,
+        max_workers: int = 10,
+        max_bytes_per_second: Optional[float] = None,
+        compress_level: Optional[int] = None,
+    ) -> None:
+        if compress_level is not None and not 0 <= compress_level <= 9:
+            raise ValueError(
+                'Compress level must be in 0-9, got: %s' % compress_level)
         self.url = url.rstrip('/')
+        self.compress_level = compress_level
+        self.part_size = part_size
+        self.part_workers = part_workers
+        self.max_workers = max_workers
+        self._bandwidth = None if max_bytes_per_second is None \
+            else TokenBucket(max_bytes_per_second)
         self._session = requests.Session()
         self._session.mount('', HTTPAdapter(max_retries=self._MAX_RETRIES))
         self._session.headers.update(
@@ -60,7 +167,10 @@ class DatasetClient:
         name: str = 'Sidekick upload',
         description: str = 'Sidekick upload',
         progress: bool = True,
-    ) -> None:
+        state_path: Optional[str] = None,
+        manifest_path: Optional[str] = None,
+        progress_callback: Optional[Callable[[UploadStats], None]] = None,
+    ) -> UploadStats:
         """Creates a dataset and uploads files to it.
 
         Args:
@@ -68,18 +178,151 @@ class DatasetClient:
             name: Name of the dataset.
             description: Description of the dataset.
             progress: Print progress.
+            state_path: File recording the progress of uploads. Rerunning
+                an interrupted upload with the same state file continues
+                the same dataset and only uploads missing files and parts.
+            manifest_path: File recording the uploads to each dataset by
+                content hash. Files already uploaded to the dataset
+                continued through `state_path` are skipped, so it requires
+                `state_path`.
+            progress_callback: Called with the upload statistics as bytes
+                are sent, at most twice per second.
+
+        Returns:
+            Bytes sent, throughput and timings of the upload, overall and
+            per file.
 
         Raises:
             FileNotFoundError: One or more filepaths not found.
-            ValueError: One or more files have a non supported extension.
+            ValueError: One or more files have a non supported extension,
+                or `manifest_path` is given without `state_path`.
             IOError: Error occurred while saving files in dataset.
 
         """
+        if manifest_path is not None and state_path is None:
+            # Without a state file every run creates a new dataset, which
+            # has no uploads to skip
+            raise ValueError('manifest_path requires state_path')
         paths = [Path(str(path)).resolve() for path in filepaths]
         self._validate_paths(paths)
+        state = UploadState(
+            None if state_path is None else Path(str(state_path)))
+        wrapper_id = state.wrapper_id
+        if wrapper_id is None:
+            wrapper_id = self._create_wrapper(name, description)
+            state.wrapper_id = wrapper_id
+        pool = ThreadPoolExecutor(
+            max_workers=max(min(self.max_workers, len(paths)), 1))
+        manifest = None if manifest_path is None \
+            else UploadManifest(Path(str(manifest_path)))
+        bytes_bar = tqdm(
+            total=sum(path.stat().st_size for path in paths),
+            unit='B',
+            unit_scale=True,
+            desc='Uploading files',
+            disable=not progress,
+        )
+        callbacks = [
+            lambda stats: bytes_bar.update(stats.done_bytes - bytes_bar.n)
+        ]
+        if progress_callback is not None:
+            callbacks.append(progress_callback)
+        stats = UploadStats(
+            {str(path): path.stat().st_size for path in paths}, callbacks)
+
+        uploads = self._stage_files(
+            paths, wrapper_id, pool, state, manifest, stats)
+        try:
+            # Files which failed to save are uploaded again by a rerun
+            self._wait_until_completed(
+                wrapper_id, uploads, progress, manifest, stats,
+                on_failed=state.discard)
+        finally:
+            # Fail fast, without waiting for uploads still in progress
+            for future in uploads:
+                future.cancel()
+            pool.shutdown(wait=False)
+            stats.close()
+            bytes_bar.close()
+        self._complete_upload(wrapper_id)
+        state.remove()
+        return stats
+
+    def build_and_upload(
+        self,
+        dataset_index: 'pd.DataFrame',
+        shard_dir: str,
+        shard_size: int = 10000,
+        name: str = 'Sidekick upload',
+        description: str = 'Sidekick upload',
+        progress: bool = True,
+        keep_shards: bool = False,
+        **kwargs: Any
+    ) -> None:
+        """Creates a dataset, uploading shards while later ones are built.
+
+        The index is split into shards of `shard_size` rows, each written
+        as a dataset zip with `create_dataset`. Shards are built one at a
+        time and each is uploaded as soon as it is written, so building and
+        uploading overlap. A shard is deleted once it is saved. Since the
+        size of a shard is only known once it is built, no `UploadStats`
+        are returned and progress is shown per saved shard, not in bytes.
+
+        Args:
+            dataset_index: DataFrame with data to encode, see
+                `create_dataset`.
+            shard_dir: Directory to write the shards to, created if missing.
+            shard_size: Number of rows per shard.
+            name: Name of the dataset.
+            description: Description of the dataset.
+            progress: Print progress.
+            keep_shards: Keep the shards after they are saved.
+            **kwargs: Passed on to `create_dataset`, e.g. `path_columns`.
+
+        Raises:
+            ValueError: `dataset_index` is empty.
+            IOError: Error occurred while saving files in dataset.
+
+        """
+        from .dataset import create_dataset
+
+        if not len(dataset_index):
+            raise ValueError('Empty dataset index')
+        kwargs.setdefault('progress', False)
+        directory = Path(str(shard_dir)).resolve()
+        directory.mkdir(parents=True, exist_ok=True)
+        starts = range(0, len(dataset_index), shard_size)
         wrapper_id = self._create_wrapper(name, description)
-        jobs_mapping = self._stage_files(paths, wrapper_id, progress)
-        self._wait_until_completed(wrapper_id, jobs_mapping, progress)
+        build_lock = threading.Lock()
+
+        def stage(number: int, start: int) -> str:
+            path = directory / ('shard-%05i.zip' % number)
+            # Shards are built one at a time, create_dataset already
+            # preprocesses in parallel
+            with build_lock:
+                create_dataset(
+                    str(path),
+                    dataset_index.iloc[start:start + shard_size],
+                    overwrite=True,
+                    **kwargs
+                )
+            return self._stage_file(path, wrapper_id)
+
+        pool = ThreadPoolExecutor(
+            max_workers=max(min(self.max_workers, len(starts)), 1))
+        uploads = {
+            pool.submit(stage, number, start):
+                directory / ('shard-%05i.zip' % number)
+            for number, start in enumerate(starts)
+        }
+        try:
+            self._wait_until_completed(
+                wrapper_id, uploads, progress,
+                on_saved=None if keep_shards else Path.unlink)
+        finally:
+            for future in uploads:
+                future.cancel()
+            pool.shutdown(wait=False)
         self._complete_upload(wrapper_id)
 
     def _create_wrapper(self, name: str, description: str) -> str:
@@ -107,46 +350,181 @@ class DatasetClient:
         response.raise_for_status()
 
     def _stage_files(
-        self, filepaths: List[Path], wrapper_id: str, progress: bool,
-    ) -> Dict[str, Path]:
+        self,
+        filepaths: List[Path],
+        wrapper_id: str,
+        pool: ThreadPoolExecutor,
+        state: Optional[UploadState] = None,
+        manifest: Optional[UploadManifest] = None,
+        stats: Optional[UploadStats] = None,
+    ) -> Dict[Future, Path]:
+        # Largest files first, so that no large file is left uploading
+        # alone at the end
+        filepaths = sorted(
+            filepaths, key=lambda path: path.stat().st_size, reverse=True)
+        uploads = dict()  # type: Dict[Future, Path]
+        for path in filepaths:
+            future = pool.submit(
+                self._stage_file, path, wrapper_id, state, manifest, stats)
+            uploads[future] = path
+        return uploads
 
-        num_files = len(filepaths)
-        status_bar = tqdm(
-            total=num_files,
-            unit='file',
-            desc='Uploading files',
-            disable=not progress,
-        )
-        workers = min(10, num_files)
-        with ThreadPoolExecutor(max_workers=workers) as pool:
-            future_to_path = {
-                pool.submit(self._stage_file, path, wrapper_id): path
-                for path in filepaths
-            }
-            job_mapping = []
-            for future in as_completed(future_to_path):
-                path = future_to_path[future]
-                job_id = future.result()
-                job_mapping.append((job_id, path))
-                status_bar.update()
-        status_bar.close()
-        return dict(job_mapping)
-
-    def _stage_file(self, filepath: Path, wrapper_id: str) -> str:
+    def _stage_file(
+        self,
+        filepath: Path,
+        wrapper_id: str,
+        state: Optional[UploadState] = None,
+        manifest: Optional[UploadManifest] = None,
+        stats: Optional[UploadStats] = None,
+    ) -> str:
+        if manifest is None:
+            return self._upload_file(filepath, wrapper_id, state, stats)
+
+        digest = manifest.file_hash(filepath)
+        upload = manifest.find(wrapper_id, digest)
+        if upload is not None and upload['status'] != Status.FAILED.name:
+            if stats is not None:
+                stats.skip(str(filepath), filepath.stat().st_size)
+            return upload['uploadId']
+        upload_id = self._upload_file(filepath, wrapper_id, state, stats)
+        manifest.record(wrapper_id, digest, filepath, upload_id,
+                        Status.PROCESSING.name)
+        return upload_id
+
+    def _upload_file(
+        self,
+        filepath: Path,
+        wrapper_id: str,
+        state: Optional[UploadState] = None,
+        stats: Optional[UploadStats] = None,
+    ) -> str:
         content_type = self._EXTENSION_MAPPING[filepath.suffix]
+        if (self.part_size is not None and
+                filepath.stat().st_size > self.part_size):
+            return self._stage_multipart(
+                filepath, wrapper_id, state or UploadState(), stats)
+        if state is not None:
+            entry = state.file(filepath, None)
+            if entry['completed']:
+                if stats is not None:
+                    stats.skip(str(filepath), entry['size'])
+                return entry['uploadId']
+
+        on_read = None if stats is None \
+            else functools.partial(stats.add, str(filepath))
 
+        headers = {'Content-Type': content_type}
+        # The file is streamed from disk in blocks, so memory use does not
+        # depend on the file size
         with filepath.open('rb') as file:
-            data = file.read()
+            if (self.compress_level is not None and
+                    filepath.suffix in self._COMPRESSIBLE_EXTENSIONS):
+                headers['Content-Encoding'] = 'gzip'
+                body = _gzip_body(file, self.compress_level,
+                                  self._bandwidth, on_read)  # type: Any
+            else:
+                body = _UploadReader(
+                    file, filepath.stat().st_size, self._bandwidth, on_read)
+            response = self._session.post(
+                url=self.url + '/%s/upload' % wrapper_id,
+                headers=headers,
+                data=body,
+            )
+        response.raise_for_status()
+        upload_id = response.json()['uploadId']
+        if state is not None:
+            state.update(filepath, uploadId=upload_id, completed=True)
+        return upload_id
+
+    def _stage_multipart(
+        self,
+        filepath: Path,
+        wrapper_id: str,
+        state: UploadState,
+        stats: Optional[UploadStats] = None,
+    ) -> str:
+        """Uploads a file in concurrent parts, skipping finished parts."""
+        part_size = self.part_size or DEFAULT_PART_SIZE
+        entry = state.file(filepath, part_size)
+        on_read = None if stats is None \
+            else functools.partial(stats.add, str(filepath))
+        if entry['completed']:
+            if stats is not None:
+                stats.skip(str(filepath), entry['size'])
+            return entry['uploadId']
+
+        url = self.url + '/%s/multipart_uploads' % wrapper_id
+        if entry['uploadId'] is None:
+            response = self._session.post(
+                url=url,
+                headers={'Content-Type': 'application/json'},
+                json={
+                    'fileName': filepath.name,
+                    'contentType': self._EXTENSION_MAPPING[filepath.suffix],
+                    'size': entry['size'],
+                    'partSize': part_size,
+                }
+            )
+            response.raise_for_status()
+            state.update(filepath, uploadId=response.json()['uploadId'])
+        url += '/%s' % entry['uploadId']
+
+        def upload(part):
+            number, offset, length = part
+            checksum = self._upload_part(
+                url, number, read_part(filepath, offset, length), on_read)
+            state.add_part(filepath, number, checksum)
+
+        parts = part_ranges(entry['size'], part_size)
+        missing = [
+            part for part in parts if str(part[0]) not in entry['parts']
+        ]
+        if stats is not None:
+            stats.skip(str(filepath), entry['size'] - sum(
+                length for _, _, length in missing))
+        with ThreadPoolExecutor(max_workers=self.part_workers) as pool:
+            for _ in pool.map(upload, missing):
+                pass
 
         response = self._session.post(
-            url=self.url + '/%s/upload' % wrapper_id,
-            headers={'Content-Type': content_type},
-            data=data
+            url=url + '/complete',
+            headers={'Content-Type': 'application/json'},
+            json={'parts': [
+                {'partNumber': number, 'etag': entry['parts'][str(number)]}
+                for number, _, _ in parts
+            ]}
         )
         response.raise_for_status()
-        return response.json()['uploadId']
+        state.update(filepath, completed=True)
+        return entry['uploadId']
 
-    def _validate_paths(self, paths: List[Path]) -> None:
+    def _upload_part(
+        self, url: str, number: int, data: bytes,
+        on_read: Optional[Callable[[int], None]] = None,
+    ) -> str:
+        """Uploads a part and verifies the checksum the server received."""
+        checksum, header = content_md5(data)
+        for attempt in range(self._MAX_RETRIES + 1):
+            response = self._session.put(
+                url=url + '/parts/%i' % number,
+                headers={
+                    'Content-Type': 'application/octet-stream',
+                    'Content-MD5': header,
+                },
+                data=_UploadReader(
+                    io.BytesIO(data), len(data), self._bandwidth, on_read)
+            )
+            response.raise_for_status()
+            etag = response.headers.get('ETag', checksum).strip('"')
+            if etag == checksum:
+                return checksum
+        raise IOError(
+            'Checksum mismatch for part %i of %s, expected: %s, got: %s' % (
+                number, url, checksum, etag)
+        )
+
+    @classmethod
+    def _validate_paths(cls, paths: List[Path]) -> None:
         """Validates that paths exist and have a supported extension."""
 
         not_found = [str(path) for path in paths if not path.exists()]
@@ -155,46 +533,100 @@ class DatasetClient:
 
         invalid_extension = [
             str(path) for path in paths
-            if path.suffix not in self.VALID_EXTENSIONS
+            if path.suffix not in cls.VALID_EXTENSIONS
         ]
         if invalid_extension:
             raise ValueError(
                 'Valid extensions: %s. Given: %s' % (
-                    self.VALID_EXTENSIONS, set(invalid_extension))
+                    cls.VALID_EXTENSIONS, set(invalid_extension))
             )
 
     def _wait_until_completed(
-        self, wrapper_id: str, job_mapping: Dict[str, Path], progress: bool,
+        self,
+        wrapper_id: str,
+        uploads: Dict[Future, Path],
+        progress: bool,
+        manifest: Optional[UploadManifest] = None,
+        stats: Optional[UploadStats] = None,
+        on_saved: Optional[Callable[[Path], None]] = None,
+        on_failed: Optional[Callable[[Path], None]] = None,
     ) -> None:
-        """Waits until all jobs are saved."""
+        """Waits until all files are uploaded and saved.
 
-        status_bar = tqdm(
-            total=len(job_mapping),
+        Polling the status starts as soon as the first file is staged, so
+        saving overlaps the remaining uploads. The polling interval doubles
+        while no job finishes and is reset when one does.
+
+        Raises:
+            IOError: As soon as saving any file fails.
+
+        """
+        save_bar = tqdm(
+            total=len(uploads),
             unit='file',
             desc='Saving files',
             disable=not progress,
         )
-        ongoing = True
-        successful_jobs = []  # type: List[str]
-
-        while ongoing:
-            ongoing = False
-            jobs = self._get_status(wrapper_id)
-            for job in jobs:
-                if job.status is Status.FAILED:
-                    raise IOError(
-                        'Error saving file: %s, message: %s' % (
-                            job_mapping[job.id], job.message
-                        )
-                    )
-                elif job.status is Status.SUCCESS:
-                    if job.id not in successful_jobs:
-                        successful_jobs.append(job.id)
-                        status_bar.update()
-                else:  # status is PROCESSING:
-                    ongoing = True
+        staging = set(uploads)
+        processing = dict()  # type: Dict[str, Path]
+        interval = self._MIN_POLL_INTERVAL
+        next_poll = 0.0
+
+        while staging or processing:
+            now = time.monotonic()
+            if staging and (not processing or now < next_poll):
+                idle = not processing
+                done, staging = wait(
+                    staging,
+                    timeout=None if idle else next_poll - now,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    processing[future.result()] = uploads[future]
+                    if stats is not None:
+                        stats.finish(str(uploads[future]))
+                if idle:
+                    next_poll = time.monotonic() + interval
+                continue
+
+            time.sleep(max(next_poll - now, 0))
+            saved = self._update_jobs(
+                wrapper_id, processing, manifest, on_saved, on_failed)
+            save_bar.update(saved)
+            interval = self._MIN_POLL_INTERVAL if saved else min(
+                interval * 2, self._MAX_POLL_INTERVAL)
+            next_poll = time.monotonic() + interval
 
-            if ongoing:
-                time.sleep(1)
+        save_bar.close()
 
-        status_bar.close()
+    def _update_jobs(
+        self,
+        wrapper_id: str,
+        processing: Dict[str, Path],
+        manifest: Optional[UploadManifest] = None,
+        on_saved: Optional[Callable[[Path], None]] = None,
+        on_failed: Optional[Callable[[Path], None]] = None,
+    ) -> int:
+        """Removes saved jobs from processing and returns their number."""
+
+        finished = [
+            job for job in self._get_status(wrapper_id)
+            if job.id in processing and job.status is not Status.PROCESSING
+        ]
+        if manifest is not None:
+            manifest.set_statuses(
+                wrapper_id, {job.id: job.status.name for job in finished})
+
+        for job in finished:
+            path = processing.pop(job.id)
+            if job.status is Status.FAILED:
+                if on_failed is not None:
+                    on_failed(path)
+                raise IOError(
+                    'Error saving file: %s, message: %s' % (
+                        path, job.message
+                    )
+                )
+            if on_saved is not None:
+                on_saved(path)
+        return len(finished)
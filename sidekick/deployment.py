@@ -1,55 +1,198 @@
+import collections
 import copy
+import gzip
+import json
+import random
+import threading
+import time
 import urllib.parse
+from concurrent.futures import (FIRST_COMPLETED, Executor, ThreadPoolExecutor,
+                                wait)
 from itertools import islice
-from typing import Any, Dict, Generator, Iterable, List
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Generator, Iterable,
+                    Iterator, List, Optional, Sequence, Tuple, TypeVar, Union)
 
 import requests
 from requests.adapters import HTTPAdapter
 
+from .compression import gzip_chunks
 from .data_models import FeatureSpec
-from .encode import DataItem, decode_feature, encode_feature
+from .encode import BinaryPayload, DataItem, EncodingPlan
+from .metrics import BatchTiming, LatencyHistogram
+from .ratelimit import RateLimiter
+from .spec_cache import DeploymentSpecs, SpecCache
+
+if TYPE_CHECKING:
+    from . import columnar
 
 PredictData = Dict[str, List[Dict[str, Any]]]
+BatchHook = Callable[[BatchTiming], None]
+T = TypeVar('T')
+
+
+class PredictionError(Exception):
+    """Error for an item which could not be predicted
+
+    Yielded in place of the prediction by resilient predictions.
+
+    Attributes:
+        item: The item which could not be predicted
+        status_code: HTTP status code of the rejected request, if any
+    """
+
+    def __init__(self,
+                 message: str,
+                 item: Optional[DataItem] = None,
+                 status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.item = item
+        self.status_code = status_code
+
+
+PredictionResult = Union[DataItem, PredictionError]
 
 
 def prediction_request(items: Iterable[DataItem],
                        feature_specs: List[FeatureSpec]) -> PredictData:
-    rows = list()
-    for item in items:
-        row = dict()
-        for feature_spec in feature_specs:
-            if feature_spec.name not in item:
-                raise ValueError(
-                    'Item is missing feature: %s' % feature_spec.name
-                )
-            feature = item[feature_spec.name]
-            row[feature_spec.name] = encode_feature(feature, feature_spec)
-        rows.append(row)
-    return {'rows': rows}
+    return {'rows': EncodingPlan(feature_specs).encode_rows(items)}
 
 
-def parse_prediction(
-        data: PredictData,
-        feature_specs: List[FeatureSpec]) -> Generator[DataItem, None, None]:
+def _json_default(value: Any) -> Any:
+    if isinstance(value, BinaryPayload):
+        return value.to_json()
+    raise TypeError('%s is not JSON serializable' % type(value))
+
+
+def serialize_request(encoded: PredictData) -> bytes:
+    return json.dumps(encoded, default=_json_default).encode()
+
+
+def _request_parts(encoded: PredictData, chunk_size: int) -> Iterator[bytes]:
+    yield b'{"rows": ['
+    for index, row in enumerate(encoded['rows']):
+        yield b', {' if index else b'{'
+        for position, (name, value) in enumerate(row.items()):
+            key = json.dumps(name) + ': '
+            if position:
+                key = ', ' + key
+            if isinstance(value, BinaryPayload):
+                yield key.encode()
+                yield from value.iter_json(chunk_size)
+            else:
+                yield (key + json.dumps(value)).encode()
+        yield b'}'
+    yield b']}'
+
+
+def iter_request_body(encoded: PredictData,
+                      chunk_size: int = 2 ** 16) -> Iterator[bytes]:
+    """Serializes a request in chunks of about `chunk_size` bytes
+
+    Binary payloads are base64 encoded chunk by chunk while serializing, so
+    the body never exists in memory as a whole.
+    """
+    buffer = bytearray()
+    for part in _request_parts(encoded, chunk_size):
+        buffer += part
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            del buffer[:]
+    if buffer:
+        yield bytes(buffer)
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Returns the seconds of a `Retry-After` header, if any
+
+    HTTP dates are not supported and ignored.
+    """
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def prediction_rows(data: PredictData) -> List[Dict[str, Any]]:
+    """Returns the encoded rows of a prediction response"""
     if 'errorCode' in data:
         raise IOError(
             '%s: %s' % (data['errorCode'], data.get('errorMessage', '')))
     if 'rows' not in data:
         raise ValueError('Return data does not contain rows')
+    return data['rows']
+
+
+def parse_prediction(
+        data: PredictData,
+        feature_specs: List[FeatureSpec],
+        lazy: bool = False) -> Generator[DataItem, None, None]:
+    plan = EncodingPlan(feature_specs)
+    if lazy:
+        yield from plan.lazy_rows(prediction_rows(data))
+    else:
+        yield from plan.decode_rows(prediction_rows(data))
+
+
+def batches(items: Iterable[T], batch_size: int) -> \
+        Generator[List[T], None, None]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+def bounded_map(function: Callable[[T], Any],
+                iterable: Iterable[T],
+                executor: Executor,
+                max_in_flight: int) -> Generator[Any, None, None]:
+    """Maps function over iterable in executor and yields results in order
+
+    At most `max_in_flight` calls are pending at any time, which bounds the
+    memory used when the iterable is large or the consumer is slow.
+    """
+    pending = collections.deque()  # type: collections.deque
+    try:
+        for value in iterable:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, value))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
 
-    for row in data['rows']:
-        item = dict()
-        for feature_spec in feature_specs:
-            if feature_spec.name not in row:
-                raise ValueError(
-                    'Item is missing feature: %s' % feature_spec.name
-                )
-
-            item[feature_spec.name] = decode_feature(
-                row[feature_spec.name],
-                feature_spec,
-            )
-        yield item
+
+def unordered_map(function: Callable[[T], Any],
+                  iterable: Iterable[T],
+                  executor: Executor,
+                  max_in_flight: int) -> \
+        Generator[Tuple[int, Any], None, None]:
+    """Maps function over iterable in executor and yields results as they
+    complete, along with the position of their value in iterable
+
+    At most `max_in_flight` calls are pending at any time.
+    """
+    pending = dict()  # type: Dict[Any, int]
+    try:
+        for position, value in enumerate(iterable):
+            while len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+            pending[executor.submit(function, value)] = position
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        for future in pending:
+            future.cancel()
 
 
 def get_feature_specs(specs: Dict) -> List[FeatureSpec]:
@@ -65,30 +208,128 @@ def get_feature_specs(specs: Dict) -> List[FeatureSpec]:
 
 class Deployment:
     """Sidekick for Peltarion platform deployments
+
+    Args:
+        url: Url of the deployment
+        token: Deployment token
+        spec_cache: Cache for the deployment specification, avoids fetching
+                    and parsing it on every instantiation
+        lazy: Defer fetching the specification until it is first needed,
+              e.g. by the first prediction
+        latency_window: Number of recent batches kept in the latency
+                        histogram
+        stream_requests: Stream request bodies with chunked transfer encoding,
+                         base64 encoding binary features while sending. This
+                         keeps a single copy of each batch's raw payload in
+                         memory instead of several serialized ones.
+        compress_level: Gzip compress request bodies at this level, from 0
+                        (no compression) to 9 (smallest). Compressed
+                        responses are always accepted.
+        rate_limiter: Limits the requests and items sent per second and
+                      adapts to rate limited responses. Rate limited
+                      requests are then always retried. May be shared
+                      between deployments.
     """
     BATCH_SIZE = 128
     MAX_RETRIES = 3
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    # Statuses a single item of a batch can cause
+    BISECT_STATUSES = frozenset({400, 413, 422})
+    BACKOFF_FACTOR = 0.5
+    MAX_BACKOFF = 30.0
 
-    def __init__(self, url: str, token: str) -> None:
+    def __init__(self,
+                 url: str,
+                 token: str,
+                 spec_cache: Optional[SpecCache] = None,
+                 lazy: bool = False,
+                 latency_window: int = 1000,
+                 stream_requests: bool = False,
+                 compress_level: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None) -> None:
+        if compress_level is not None and not 0 <= compress_level <= 9:
+            raise ValueError('Compression level must be between 0 and 9, '
+                             'got: %s' % compress_level)
         self._headers = {'Authorization': 'Bearer ' + token}
         self._url = url
+        self._stream_requests = stream_requests
+        self._compress_level = compress_level
+        self._rate_limiter = rate_limiter
+        self._spec_cache = spec_cache
+        self._specs = None  # type: Optional[DeploymentSpecs]
+        self._specs_lock = threading.Lock()
+        self._plans = None  # type: Optional[Tuple[EncodingPlan, EncodingPlan]]
+        self._batch_hooks = []  # type: List[BatchHook]
+        self._latency = LatencyHistogram(latency_window)
 
         self._session = requests.Session()
         self._session.mount('', HTTPAdapter(max_retries=self.MAX_RETRIES))
-        self._session.headers.update({'User-Agent': 'sidekick'})
+        self._session.headers.update({
+            'User-Agent': 'sidekick',
+            'Accept-Encoding': 'gzip, deflate',
+        })
 
-        response = self._session.get(
-            url=urllib.parse.urljoin(url, 'openapi.json'),
-            headers=self._headers,
-        )
-        response.raise_for_status()
-        specs = response.json()['components']['schemas']
-        self._feature_specs_in = get_feature_specs(
-            specs['input-row']['properties']
-        )
-        self._feature_specs_out = get_feature_specs(
-            specs['output-row-batch']['properties']['rows']['properties']
-        )
+        if not lazy:
+            self._load_specs()
+
+    def _load_specs(self) -> DeploymentSpecs:
+        specs = self._specs
+        if specs is None:
+            with self._specs_lock:
+                if self._specs is None:
+                    self._specs = self._fetch_specs()
+                specs = self._specs
+        return specs
+
+    def _fetch_specs(self) -> DeploymentSpecs:
+        specs_url = urllib.parse.urljoin(self._url, 'openapi.json')
+        cached = None
+        if self._spec_cache is not None:
+            cached = self._spec_cache.get(specs_url)
+            if cached is not None and self._spec_cache.is_fresh(cached):
+                return cached
+
+        headers = dict(self._headers)
+        if cached is not None and cached.etag is not None:
+            headers['If-None-Match'] = cached.etag
+        response = self._session.get(url=specs_url, headers=headers)
+
+        if cached is not None and response.status_code == 304:
+            specs = cached.revalidated()
+        else:
+            response.raise_for_status()
+            schemas = response.json()['components']['schemas']
+            rows = schemas['output-row-batch']['properties']['rows']
+            specs = DeploymentSpecs(
+                feature_specs_in=get_feature_specs(
+                    schemas['input-row']['properties']
+                ),
+                feature_specs_out=get_feature_specs(rows['properties']),
+                etag=response.headers.get('ETag'),
+            )
+
+        if self._spec_cache is not None:
+            self._spec_cache.set(specs_url, specs)
+        return specs
+
+    @property
+    def _feature_specs_in(self) -> List[FeatureSpec]:
+        return self._load_specs().feature_specs_in
+
+    @property
+    def _feature_specs_out(self) -> List[FeatureSpec]:
+        return self._load_specs().feature_specs_out
+
+    def _load_plans(self) -> Tuple[EncodingPlan, EncodingPlan]:
+        plans = self._plans
+        if plans is None:
+            specs = self._load_specs()
+            plans = (
+                EncodingPlan(specs.feature_specs_in),
+                EncodingPlan(specs.feature_specs_out),
+            )
+            self._plans = plans
+        return plans
 
     @property
     def feature_specs_in(self) -> List[FeatureSpec]:
@@ -98,28 +339,320 @@ class Deployment:
     def feature_specs_out(self) -> List[FeatureSpec]:
         return copy.deepcopy(self._feature_specs_out)
 
-    def predict_lazy(self, items: Iterable[DataItem]) -> \
-            Generator[DataItem, None, None]:
-        iterator = iter(items)
-        while True:
-            batch = list(islice(iterator, self.BATCH_SIZE))
-            if not batch:
-                break
+    @property
+    def latency(self) -> LatencyHistogram:
+        """Rolling histogram of total batch latencies in seconds"""
+        return self._latency
+
+    def add_batch_hook(self, hook: BatchHook) -> None:
+        """Adds a callback receiving the `BatchTiming` of every batch"""
+        self._batch_hooks.append(hook)
+
+    def remove_batch_hook(self, hook: BatchHook) -> None:
+        self._batch_hooks.remove(hook)
 
-            encoded = prediction_request(batch, self._feature_specs_in)
+    def _record(self, timing: BatchTiming) -> None:
+        self._latency.add(timing.total_time)
+        for hook in self._batch_hooks:
+            hook(timing)
+
+    def predict_lazy(self,
+                     items: Iterable[DataItem],
+                     resilient: bool = False,
+                     lazy_decode: bool = False) -> \
+            Generator[PredictionResult, None, None]:
+        """Lazily predicts items in batches
+
+        Args:
+            items: Items to predict
+            resilient: Retry transient errors (429 and 5xx) with jittered
+                       backoff and isolate items rejected by the deployment
+                       by repeatedly splitting batches rejected with 400,
+                       413 or 422. Items which cannot be predicted yield a
+                       `PredictionError` in place of the prediction instead
+                       of raising. Other errors, e.g. 401 or 404, still
+                       raise.
+            lazy_decode: Yield read-only views of the predictions which
+                         decode each feature when it is first accessed.
+                         Decoding errors are then raised on access.
+        """
+        for batch in batches(items, self.BATCH_SIZE):
+            yield from self._predict_batch(batch, resilient, lazy_decode)
+
+    def predict_unordered(self,
+                          items: Iterable[DataItem],
+                          max_in_flight: int = 4,
+                          resilient: bool = False,
+                          lazy_decode: bool = False) -> \
+            Generator[Tuple[int, PredictionResult], None, None]:
+        """Lazily predicts items in concurrent batches, in completion order
+
+        A slow batch does not hold back the batches sent after it, so this is
+        faster than `predict_lazy` when the order of predictions does not
+        matter, e.g. when storing them by key.
+
+        Args:
+            items: Items to predict
+            max_in_flight: Number of concurrent requests
+            resilient: See `predict_lazy`
+            lazy_decode: See `predict_lazy`
+
+        Returns:
+            Generator of pairs of item position and prediction
+        """
+        def predict_batch(batch: List[DataItem]) -> List[PredictionResult]:
+            return self._predict_batch(batch, resilient, lazy_decode)
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            for index, predictions in unordered_map(
+                    predict_batch,
+                    batches(items, self.BATCH_SIZE),
+                    pool,
+                    max_in_flight):
+                start = index * self.BATCH_SIZE
+                for offset, prediction in enumerate(predictions):
+                    yield start + offset, prediction
+
+    def _predict_batch(self,
+                       batch: List[DataItem],
+                       resilient: bool = False,
+                       lazy_decode: bool = False) -> List[PredictionResult]:
+        if resilient:
+            return self._predict_resilient(batch, lazy_decode)
+        timing = BatchTiming(len(batch))
+        encoded = self._encode_batch(batch, timing)
+        return list(self._predict_encoded(
+            encoded, timing=timing, lazy_decode=lazy_decode))
+
+    def _encode_batch(self,
+                      items: Iterable[DataItem],
+                      timing: Optional[BatchTiming] = None) -> PredictData:
+        start = time.perf_counter()
+        plan_in, _ = self._load_plans()
+        encoded = {'rows': plan_in.encode_rows(items, self._stream_requests)}
+        if timing is not None:
+            timing.encode_time += time.perf_counter() - start
+        return encoded
+
+    def _request(self,
+                 encoded: PredictData,
+                 timing: BatchTiming,
+                 retry: bool = False) -> PredictData:
+        """Posts an encoded batch, optionally retrying transient errors"""
+        headers = dict(self._headers)
+        headers['Content-Type'] = 'application/json'
+        if self._compress_level is not None:
+            headers['Content-Encoding'] = 'gzip'
+        stream = self._stream_requests
+        body = b''
+        if not stream:
+            start = time.perf_counter()
+            body = serialize_request(encoded)
+            if self._compress_level is not None:
+                body = gzip.compress(body, self._compress_level)
+            timing.encode_time += time.perf_counter() - start
+            timing.request_bytes = len(body)
+
+        limiter = self._rate_limiter
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire(len(encoded['rows']))
             response = self._session.post(
                 url=self._url,
-                headers=self._headers,
-                json=encoded
-            )
-            response.raise_for_status()  # Raise exceptions
-            yield from parse_prediction(
-                response.json(),
-                self._feature_specs_out
+                headers=headers,
+                data=self._stream_body(encoded, timing) if stream else body
             )
+            status_code = response.status_code
+            limited = limiter is not None and status_code == 429
+            if limiter is not None:
+                limiter.record(status_code, retry_after(response))
+            if (not (retry or limited) or attempt >= self.MAX_RETRIES or
+                    status_code not in self.RETRY_STATUSES):
+                break
+            if not limited:
+                # The rate limiter already delays the next request
+                time.sleep(self._backoff(attempt, response))
+            attempt += 1
+        timing.request_time = time.perf_counter() - start
+        timing.retries = attempt
+        response.raise_for_status()  # Raise exceptions
+
+        start = time.perf_counter()
+        content = response.content
+        data = json.loads(content.decode())
+        timing.parse_time = time.perf_counter() - start
+        timing.response_bytes = len(content)
+        return data
+
+    def _stream_body(self, encoded: PredictData, timing: BatchTiming) \
+            -> Iterator[bytes]:
+        timing.request_bytes = 0
+        chunks = iter_request_body(encoded)
+        if self._compress_level is not None:
+            chunks = gzip_chunks(chunks, self._compress_level)
+        for chunk in chunks:
+            timing.request_bytes += len(chunk)
+            yield chunk
+
+    def _backoff(self, attempt: int, response: requests.Response) -> float:
+        delay = retry_after(response)
+        if delay is not None:
+            return min(delay, self.MAX_BACKOFF)
+        # Full jitter avoids retrying clients hitting the server in lockstep
+        return random.uniform(
+            0, min(self.MAX_BACKOFF, self.BACKOFF_FACTOR * 2 ** attempt))
+
+    def _predict_encoded(self,
+                         encoded: PredictData,
+                         retry: bool = False,
+                         timing: Optional[BatchTiming] = None,
+                         lazy_decode: bool = False) -> List[DataItem]:
+        """Sends an already encoded batch and returns the decoded items"""
+        if timing is None:
+            timing = BatchTiming(len(encoded['rows']))
+        data = self._request(encoded, timing, retry)
+
+        start = time.perf_counter()
+        _, plan_out = self._load_plans()
+        rows = prediction_rows(data)
+        if lazy_decode:
+            predictions = list(
+                plan_out.lazy_rows(rows))  # type: List[DataItem]
+        else:
+            predictions = list(plan_out.decode_rows(rows))
+        timing.decode_time = time.perf_counter() - start
+        self._record(timing)
+        return predictions
+
+    def _predict_resilient(self,
+                           batch: Sequence[DataItem],
+                           lazy_decode: bool = False) -> \
+            List[PredictionResult]:
+        results = [None] * len(batch)  # type: List[Any]
+        rows, positions = [], []
+        timing = BatchTiming(len(batch))
+        for position, item in enumerate(batch):
+            try:
+                rows.append(self._encode_batch([item], timing)['rows'][0])
+                positions.append(position)
+            except (TypeError, ValueError) as error:
+                results[position] = PredictionError(str(error), item)
+        timing.batch_size = len(rows)
+
+        predictions = self._predict_bisect(
+            rows, [batch[position] for position in positions], lazy_decode,
+            timing)
+        for position, prediction in zip(positions, predictions):
+            results[position] = prediction
+        return results
+
+    def _predict_bisect(self,
+                        rows: List[Dict[str, Any]],
+                        items: List[DataItem],
+                        lazy_decode: bool = False,
+                        timing: Optional[BatchTiming] = None) \
+            -> List[PredictionResult]:
+        """Predicts rows, splitting rejected batches to isolate bad items
+
+        `timing` holds the encoding time of the rows, split batches are
+        timed on their own.
+        """
+        if not rows:
+            return []
+        try:
+            predictions = list(self._predict_encoded(
+                {'rows': rows}, retry=True, timing=timing,
+                lazy_decode=lazy_decode)
+            )  # type: List[PredictionResult]
+            if len(predictions) != len(rows):
+                raise ValueError('Expected %i predictions, got: %i'
+                                 % (len(rows), len(predictions)))
+            return predictions
+        except requests.HTTPError as error:
+            if error.response is None:
+                return [PredictionError(str(error), item) for item in items]
+            status_code = error.response.status_code
+            if status_code in self.RETRY_STATUSES:
+                # Retries are exhausted, splitting would only add load
+                return [PredictionError(str(error), item, status_code)
+                        for item in items]
+            if status_code not in self.BISECT_STATUSES:
+                # No item causes e.g. an invalid token or url
+                raise
+            failure = PredictionError(str(error), None, status_code)
+        except requests.RequestException as error:
+            return [PredictionError(str(error), item) for item in items]
+        except (IOError, ValueError, TypeError) as error:
+            failure = PredictionError(str(error))
+
+        if len(rows) == 1:
+            failure.item = items[0]
+            return [failure]
+        middle = len(rows) // 2
+        return (
+            self._predict_bisect(rows[:middle], items[:middle], lazy_decode) +
+            self._predict_bisect(rows[middle:], items[middle:], lazy_decode)
+        )
+
+    def predict_many(self,
+                     items: Iterable[DataItem],
+                     resilient: bool = False,
+                     lazy_decode: bool = False) -> List[PredictionResult]:
+        return list(self.predict_lazy(
+            items, resilient=resilient, lazy_decode=lazy_decode))
+
+    def predict_columns(self, data: 'columnar.Columns') \
+            -> 'columnar.Columns':
+        """Predicts columnar data
+
+        Features are encoded and decoded column by column, which avoids
+        creating a dict for every item.
+
+        Args:
+            data: DataFrame or dict of equally long columns, e.g. numpy arrays
+                  with the items stacked along the first axis
+
+        Returns:
+            A DataFrame with the same index for DataFrame input, otherwise a
+            dict of arrays with the predictions stacked along the first axis
+        """
+        # Imported here as pandas is slow to import and not needed otherwise
+        import pandas as pd
+
+        from . import columnar
+
+        specs_in, specs_out = self._feature_specs_in, self._feature_specs_out
+        length = columnar.num_rows(data)
+        chunks = []
+        for start in range(0, length, self.BATCH_SIZE):
+            chunk = columnar.slice_rows(data, start, start + self.BATCH_SIZE)
+            timing = BatchTiming(columnar.num_rows(chunk))
+
+            encode_start = time.perf_counter()
+            rows = columnar.encode_columns(chunk, specs_in)
+            timing.encode_time = time.perf_counter() - encode_start
+
+            response = self._request({'rows': rows}, timing)
+
+            decode_start = time.perf_counter()
+            predictions = prediction_rows(response)
+            if len(predictions) != len(rows):
+                raise ValueError('Expected %i predictions, got: %i'
+                                 % (len(rows), len(predictions)))
+            chunks.append(columnar.decode_columns(predictions, specs_out))
+            timing.decode_time = time.perf_counter() - decode_start
+            self._record(timing)
 
-    def predict_many(self, items: Iterable[DataItem]) -> List[DataItem]:
-        return list(self.predict_lazy(items))
+        if not chunks:
+            chunks.append(columnar.decode_columns([], specs_out))
+        columns = columnar.concatenate_columns(chunks, specs_out)
+        if isinstance(data, pd.DataFrame):
+            return columnar.to_frame(columns, data.index)
+        return columns
 
     def predict(self, **item) -> DataItem:
-        return self.predict_many([item])[0]
+        timing = BatchTiming(1)
+        encoded = self._encode_batch([item], timing)
+        return self._predict_encoded(encoded, timing=timing)[0]
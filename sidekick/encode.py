@@ -1,8 +1,11 @@
 import abc
 import base64
+import collections.abc
 import io
 import itertools
-from typing import Any, Mapping, Set, Tuple
+import pathlib
+from typing import (Any, Dict, Iterable, Iterator, List, Mapping, Sequence,
+                    Set, Tuple)
 
 import numpy as np
 from PIL import Image
@@ -11,6 +14,27 @@ from .data_models import FeatureSpec
 
 DataItem = Mapping[str, Any]
 
+# Already encoded bytes or paths to files, sent as is by binary encoders.
+# Paths must be given as `pathlib.Path` since strings are plain text values.
+SOURCE_TYPES = (bytes, pathlib.PurePath)
+
+_MAGIC_MEDIA_TYPES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x93NUMPY', 'application/x.peltarion.npy'),
+)
+_PNG_ALPHA_COLOR_TYPES = frozenset({4, 6})
+# Large enough for the longest header of the npy format
+_SOURCE_HEADER_SIZE = 2 ** 16 + 16
+
+
+def sniff_media_type(header: bytes) -> str:
+    """Determines the media type of encoded data from its first bytes"""
+    for magic, media_type in _MAGIC_MEDIA_TYPES:
+        if header.startswith(magic):
+            return media_type
+    raise ValueError('Unknown file format, header: %r' % header[:8])
+
 
 class Encoder(abc.ABC):
 
@@ -40,6 +64,10 @@ class Encoder(abc.ABC):
     def check_shape(self, value, shape):
         pass
 
+    def check_shapes(self, values, shape):
+        for value in values:
+            self.check_shape(value, shape)
+
     def check_type(self, value):
         expected_types = self.expects()
         if not isinstance(value, tuple(expected_types)):
@@ -48,6 +76,51 @@ class Encoder(abc.ABC):
             )
 
 
+class BinaryPayload:
+    """Binary feature value serialized as a base64 data URL
+
+    Payloads can be serialized in chunks, so that the base64 encoded data
+    never needs to exist as a whole. Files are read in chunks as well.
+
+    Args:
+        media_type: Media type of the data
+        source: Encoded bytes or path to a file with the encoded data
+    """
+    __slots__ = ('media_type', 'source')
+
+    def __init__(self, media_type: str, source) -> None:
+        self.media_type = media_type
+        self.source = source
+
+    def _data_chunks(self, chunk_size: int) -> Iterator[bytes]:
+        if isinstance(self.source, bytes):
+            for start in range(0, len(self.source), chunk_size):
+                yield self.source[start:start + chunk_size]
+        else:
+            with open(str(self.source), 'rb') as file:
+                chunk = file.read(chunk_size)
+                while chunk:
+                    yield chunk
+                    chunk = file.read(chunk_size)
+
+    def iter_json(self, chunk_size: int = 2 ** 16) -> Iterator[bytes]:
+        """Yields the payload as json string in chunks"""
+        # Chunks of a multiple of 3 bytes encode to base64 without padding
+        chunk_size = max(chunk_size // 4 * 3, 3)
+        yield ('"data:%s;base64,' % self.media_type).encode()
+        for chunk in self._data_chunks(chunk_size):
+            yield base64.b64encode(chunk)
+        yield b'"'
+
+    def to_json(self) -> str:
+        if isinstance(self.source, bytes):
+            data = self.source
+        else:
+            data = pathlib.Path(str(self.source)).read_bytes()
+        return 'data:%s;base64,%s' % (
+            self.media_type, base64.b64encode(data).decode())
+
+
 class BinaryEncoder(Encoder):
 
     @abc.abstractmethod
@@ -68,6 +141,42 @@ class BinaryEncoder(Encoder):
             base64.b64encode(self.encode(value)).decode()
         )
 
+    def source_media_types(self) -> Set[str]:
+        """Media types accepted as already encoded source"""
+        return set()
+
+    def check_source(self, data: bytes, shape: Tuple[int, ...]):
+        """Validates already encoded data without decoding it"""
+        pass
+
+    def source_payload(self, source, shape: Tuple[int, ...]) \
+            -> 'BinaryPayload':
+        """Validates encoded bytes or a file from its header
+
+        Files are only read up to the header, their content is read when the
+        payload is serialized.
+        """
+        if isinstance(source, bytes):
+            header = source[:_SOURCE_HEADER_SIZE]
+        else:
+            with open(str(source), 'rb') as file:
+                header = file.read(_SOURCE_HEADER_SIZE)
+        media_type = sniff_media_type(header)
+        if media_type not in self.source_media_types():
+            raise ValueError(
+                'Not a valid media type, expected one of %s but got %s'
+                % (self.source_media_types(), media_type))
+        self.check_source(header, shape)
+        return BinaryPayload(media_type, source)
+
+    def encode_source_json(self, source, shape: Tuple[int, ...]) -> str:
+        """Encodes bytes or a file as is, without decoding it"""
+        return self.source_payload(source, shape).to_json()
+
+    def payload(self, value) -> 'BinaryPayload':
+        """Encodes a value to a payload, base64 encoded when serialized"""
+        return BinaryPayload(self.media_type(value), self.encode(value))
+
     def decode_json(self, encoded: str) -> Any:
         try:
             data_type, b64_data = encoded.split(',', 1)
@@ -94,6 +203,12 @@ class CategoricalEncoder(Encoder):
             raise ValueError('Categorical expected %i values, got: %i'
                              % (shape[0], len(value)))
 
+    def check_shapes(self, values, shape):
+        for length in {len(value) for value in values}:
+            if length != shape[0]:
+                raise ValueError('Categorical expected %i values, got: %i'
+                                 % (shape[0], length))
+
     def encode(self, value):
         return value
 
@@ -109,6 +224,9 @@ class TextEncoder(Encoder):
     def check_shape(self, value: str, shape: Tuple[int]):
         pass
 
+    def check_shapes(self, values, shape):
+        pass
+
     def encode(self, value):
         return value
 
@@ -124,6 +242,9 @@ class NumericEncoder(Encoder):
     def check_shape(self, value, shape):
         pass
 
+    def check_shapes(self, values, shape):
+        pass
+
     def encode(self, value):
         return value
 
@@ -147,6 +268,30 @@ class NumpyEncoder(BinaryEncoder):
             raise ValueError('Expected shape: %s, numpy array has shape: %s'
                              % (shape, value.shape))
 
+    def check_shapes(self, values, shape):
+        for value_shape in {value.shape for value in values}:
+            if value_shape != shape:
+                raise ValueError(
+                    'Expected shape: %s, numpy array has shape: %s'
+                    % (shape, value_shape))
+
+    def source_media_types(self) -> Set[str]:
+        return {'application/x.peltarion.npy'}
+
+    def check_source(self, data: bytes, shape: Tuple[int, ...]):
+        with io.BytesIO(data) as buffer:
+            version = np.lib.format.read_magic(buffer)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(buffer)
+            else:
+                header = np.lib.format.read_array_header_2_0(buffer)
+        source_shape, _, dtype = header
+        if source_shape != shape:
+            raise ValueError('Expected shape: %s, numpy array has shape: %s'
+                             % (shape, source_shape))
+        if dtype != np.dtype(np.float32):
+            raise ValueError('Expected a float32 numpy array, got: %s' % dtype)
+
     def encode(self, value: np.ndarray) -> bytes:
         value = value.astype(np.float32)
         with io.BytesIO() as buffer:
@@ -174,9 +319,22 @@ class ImageEncoder(BinaryEncoder):
     def expects(self) -> Set:
         return {Image.Image}
 
+    def source_media_types(self) -> Set[str]:
+        return {'image/png', 'image/jpeg'}
+
+    def check_source(self, data: bytes, shape: Tuple[int, ...]):
+        # Color type of a PNG is the 26th byte, in the IHDR chunk
+        if data.startswith(b'\x89PNG') and len(data) > 25 and \
+                data[25] in _PNG_ALPHA_COLOR_TYPES:
+            raise ValueError('PNGs with alpha channel are not supported, '
+                             'pass the image as PIL Image to convert it')
+
     def check_shape(self, image: Image, shape: Tuple[int, ...]):
         pass
 
+    def check_shapes(self, values, shape):
+        pass
+
     def encode(self, value: Image) -> bytes:
         original_format = value.format
         # We do not support 4-channel PNGs or alpha in general
@@ -237,3 +395,172 @@ def decode_feature(feature, specs: FeatureSpec) -> Any:
     encoder.check_type(decoded)
     encoder.check_shape(decoded, specs.shape)
     return decoded
+
+
+class FeaturePlan:
+    """Encoder and validation bound to a single feature
+
+    The encoder is looked up and the expected types are built once, types
+    already validated are remembered so that checking a value of a known type
+    is a single set lookup.
+    """
+
+    def __init__(self, spec: FeatureSpec) -> None:
+        self.name = spec.name
+        self.shape = tuple(spec.shape)
+        self.encoder = get_encoder(spec.dtype, self.shape)
+        self._source_encoder = (
+            self.encoder if isinstance(self.encoder, BinaryEncoder) else None
+        )
+        self._expected_types = tuple(self.encoder.expects())
+        self._input_types = self._expected_types
+        if self._source_encoder is not None:
+            self._input_types += SOURCE_TYPES
+        self._valid_types = set()  # type: Set[type]
+        self._valid_input_types = set()  # type: Set[type]
+
+    def check_types(self, values: Iterable[Any]) -> None:
+        self._check_types(values, self._expected_types, self._valid_types)
+
+    def check_input_types(self, values: Iterable[Any]) -> None:
+        """Like `check_types` but also accepts sources for binary features"""
+        self._check_types(values, self._input_types, self._valid_input_types)
+
+    def _check_types(self,
+                     values: Iterable[Any],
+                     expected_types: Tuple[type, ...],
+                     valid_types: Set[type]) -> None:
+        for value_type in set(map(type, values)):
+            if value_type in valid_types:
+                continue
+            if not issubclass(value_type, expected_types):
+                raise TypeError('Expected %s but received %s'
+                                % (self.encoder.expects(), value_type))
+            valid_types.add(value_type)
+
+    def encode_many(self,
+                    values: Sequence[Any],
+                    stream: bool = False) -> List[Any]:
+        """Validates and encodes the values of a feature for a whole batch
+
+        Binary features also accept encoded bytes or file paths, which are
+        validated from their header and sent without being decoded.
+
+        Args:
+            values: Values of the feature
+            stream: Encode binary features to `BinaryPayload`s, which are
+                    base64 encoded in chunks when serialized
+        """
+        self.check_input_types(values)
+        encoder = self._source_encoder
+        if encoder is None:
+            self.encoder.check_shapes(values, self.shape)
+            encode_json = self.encoder.encode_json
+            return [encode_json(value) for value in values]
+
+        sources = [isinstance(value, SOURCE_TYPES) for value in values]
+        encoder.check_shapes(
+            [value for value, source in zip(values, sources) if not source],
+            self.shape)
+        payloads = [
+            encoder.source_payload(value, self.shape) if source
+            else encoder.payload(value)
+            for value, source in zip(values, sources)
+        ]
+        if stream:
+            return payloads
+        return [payload.to_json() for payload in payloads]
+
+    def decode(self, encoded: Any) -> Any:
+        value = self.encoder.decode_json(encoded)
+        self.check_types([value])
+        self.encoder.check_shape(value, self.shape)
+        return value
+
+    def decode_many(self, encoded: Sequence[Any]) -> List[Any]:
+        """Decodes and validates the values of a feature for a whole batch"""
+        decode_json = self.encoder.decode_json
+        values = [decode_json(value) for value in encoded]
+        self.check_types(values)
+        self.encoder.check_shapes(values, self.shape)
+        return values
+
+
+class LazyItem(collections.abc.Mapping):
+    """Read-only view of a prediction which decodes features on first access
+
+    Decoded features are cached, features which are never accessed are never
+    decoded.
+    """
+    __slots__ = ('_row', '_features', '_decoded')
+
+    def __init__(self,
+                 row: Mapping[str, Any],
+                 features: Mapping[str, FeaturePlan]) -> None:
+        self._row = row
+        self._features = features
+        self._decoded = dict()  # type: Dict[str, Any]
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._decoded[name]
+        except KeyError:
+            value = self._features[name].decode(self._row[name])
+            self._decoded[name] = value
+            return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._features)
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def __repr__(self):
+        return 'LazyItem(features=%s, decoded=%s)' % (
+            list(self._features), list(self._decoded))
+
+
+class EncodingPlan:
+    """Encoding and decoding of items compiled once from feature specs
+
+    Items are encoded and decoded feature by feature, so that each feature is
+    validated in a single step for the whole batch.
+    """
+
+    def __init__(self, feature_specs: Iterable[FeatureSpec]) -> None:
+        self.features = [FeaturePlan(spec) for spec in feature_specs]
+        self._features_by_name = collections.OrderedDict(
+            (feature.name, feature) for feature in self.features)
+
+    def _column(self, rows: Sequence[Mapping[str, Any]], name: str) -> List:
+        try:
+            return [row[name] for row in rows]
+        except KeyError:
+            raise ValueError('Item is missing feature: %s' % name)
+
+    def encode_rows(self,
+                    items: Iterable[DataItem],
+                    stream: bool = False) -> List[Dict[str, Any]]:
+        items = list(items)
+        rows = [dict() for _ in items]  # type: List[Dict[str, Any]]
+        for feature in self.features:
+            values = feature.encode_many(
+                self._column(items, feature.name), stream)
+            for row, value in zip(rows, values):
+                row[feature.name] = value
+        return rows
+
+    def decode_rows(self, rows: Sequence[Mapping[str, Any]]) \
+            -> List[Dict[str, Any]]:
+        items = [dict() for _ in rows]  # type: List[Dict[str, Any]]
+        for feature in self.features:
+            values = feature.decode_many(self._column(rows, feature.name))
+            for item, value in zip(items, values):
+                item[feature.name] = value
+        return items
+
+    def lazy_rows(self, rows: Sequence[Mapping[str, Any]]) -> List[LazyItem]:
+        """Wraps rows in views decoding each feature on first access"""
+        for feature in self.features:
+            self._column(rows, feature.name)  # Fail early on missing features
+        return [LazyItem(row, self._features_by_name) for row in rows]
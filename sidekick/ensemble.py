@@ -0,0 +1,115 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Generator, Iterable, List, Mapping
+
+from .data_models import FeatureSpec
+from .deployment import Deployment, batches, bounded_map
+from .encode import DataItem, EncodingPlan
+
+
+class DeploymentEnsemble:
+    """Sends the same items to several deployments
+
+    Each batch is encoded once with the union of the deployments' input
+    features and then sent to every deployment concurrently, so encoding
+    cost does not grow with the number of deployments. Features shared by
+    several deployments must have the same specification.
+
+    Args:
+        deployments: Deployments by name
+        max_in_flight: Number of batches predicted concurrently, each batch
+                       is sent to all deployments at once
+
+    Raises:
+        ValueError: No deployments given or their input specs conflict
+    """
+    BATCH_SIZE = Deployment.BATCH_SIZE
+
+    def __init__(self,
+                 deployments: Mapping[str, Deployment],
+                 max_in_flight: int = 2) -> None:
+        if not deployments:
+            raise ValueError('At least one deployment is required')
+        self._deployments = dict(deployments)
+        self._feature_specs_in = self._union_specs(self._deployments)
+        self._plan = EncodingPlan(self._feature_specs_in)
+        self._names_in = {
+            name: [spec.name for spec in deployment._feature_specs_in]
+            for name, deployment in self._deployments.items()
+        }
+        self._stream_requests = any(
+            deployment._stream_requests
+            for deployment in self._deployments.values()
+        )
+        self._max_in_flight = max_in_flight
+
+    @staticmethod
+    def _union_specs(deployments: Mapping[str, Deployment]) \
+            -> List[FeatureSpec]:
+        union = dict()  # type: Dict[str, FeatureSpec]
+        owners = dict()  # type: Dict[str, str]
+        for name, deployment in deployments.items():
+            for spec in deployment._feature_specs_in:
+                if spec.name not in union:
+                    union[spec.name] = spec
+                    owners[spec.name] = name
+                elif union[spec.name] != spec:
+                    raise ValueError(
+                        'Feature %s of %s does not match %s'
+                        % (spec.name, name, owners[spec.name])
+                    )
+        return list(union.values())
+
+    @property
+    def feature_specs_in(self) -> List[FeatureSpec]:
+        """Union of the input features of all deployments"""
+        return copy.deepcopy(self._feature_specs_in)
+
+    def _predict_batch(self,
+                       batch: List[DataItem],
+                       pool: ThreadPoolExecutor) -> List[Dict[str, DataItem]]:
+        rows = self._plan.encode_rows(batch, self._stream_requests)
+        futures = {
+            name: pool.submit(
+                deployment._predict_encoded,
+                {'rows': [
+                    {feature: row[feature] for feature in
+                     self._names_in[name]}
+                    for row in rows
+                ]}
+            )
+            for name, deployment in self._deployments.items()
+        }
+        results = [dict() for _ in batch]  # type: List[Dict[str, DataItem]]
+        for name, future in futures.items():
+            predictions = future.result()
+            if len(predictions) != len(batch):
+                raise ValueError('Expected %i predictions from %s, got: %i'
+                                 % (len(batch), name, len(predictions)))
+            for result, prediction in zip(results, predictions):
+                result[name] = prediction
+        return results
+
+    def predict_lazy(self, items: Iterable[DataItem]) -> \
+            Generator[Dict[str, DataItem], None, None]:
+        """Lazily predicts items with every deployment
+
+        Returns:
+            Generator of dicts mapping deployment name to prediction
+        """
+        max_requests = self._max_in_flight * len(self._deployments)
+        with ThreadPoolExecutor(max_workers=self._max_in_flight) as encoders, \
+                ThreadPoolExecutor(max_workers=max_requests) as senders:
+            for results in bounded_map(
+                    lambda batch: self._predict_batch(batch, senders),
+                    batches(items, self.BATCH_SIZE),
+                    encoders,
+                    self._max_in_flight):
+                yield from results
+
+    def predict_many(self, items: Iterable[DataItem]) \
+            -> List[Dict[str, DataItem]]:
+        return list(self.predict_lazy(items))
+
+    def predict(self, **item) -> Dict[str, DataItem]:
+        return self.predict_many([item])[0]
@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Generator, Iterable, List, Sequence, Tuple
+
+import requests
+
+from .data_models import FeatureSpec
+from .deployment import (Deployment, PredictData, batches, bounded_map,
+                         unordered_map)
+from .encode import DataItem
+
+
+def _replica_error(error: requests.HTTPError) -> bool:
+    """Whether an error response is caused by the replica, e.g. when it is
+    overloaded, rather than by the batch"""
+    if error.response is None:
+        return True
+    status_code = error.response.status_code
+    return status_code == 429 or status_code >= 500
+
+
+class _Replica:
+    def __init__(self, deployment: Deployment) -> None:
+        self.deployment = deployment
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+
+class DeploymentGroup:
+    """Spreads predictions over several replicas of the same deployment
+
+    Batches are sent to the replica with the fewest outstanding requests.
+    Batches failing with a connection error, 429 or 5xx response are retried
+    on another replica. Replicas failing `max_failures` times in a row are
+    ejected for `ejection_time` seconds, during which their batches are sent
+    to the remaining replicas.
+
+    Args:
+        endpoints: Pairs of url and token, one per replica
+        max_in_flight: Number of concurrent requests per replica
+        max_failures: Consecutive failures before a replica is ejected
+        ejection_time: Seconds an ejected replica receives no requests
+        **kwargs: Passed on to each `Deployment`, e.g. `spec_cache`
+
+    Raises:
+        ValueError: No endpoints given or the replicas' specs differ
+    """
+    BATCH_SIZE = Deployment.BATCH_SIZE
+
+    def __init__(self,
+                 endpoints: Sequence[Tuple[str, str]],
+                 max_in_flight: int = 2,
+                 max_failures: int = 3,
+                 ejection_time: float = 30.0,
+                 **kwargs: Any) -> None:
+        if not endpoints:
+            raise ValueError('At least one endpoint is required')
+        deployments = [
+            Deployment(url=url, token=token, **kwargs)
+            for url, token in endpoints
+        ]
+        self._check_specs(deployments)
+
+        self._replicas = [_Replica(deployment) for deployment in deployments]
+        self._max_in_flight = max_in_flight
+        self._max_failures = max_failures
+        self._ejection_time = ejection_time
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _check_specs(deployments: List[Deployment]) -> None:
+        first = deployments[0]
+        for deployment in deployments[1:]:
+            if (deployment.feature_specs_in != first.feature_specs_in or
+                    deployment.feature_specs_out != first.feature_specs_out):
+                raise ValueError(
+                    'Specs of %s do not match %s'
+                    % (deployment._url, first._url)
+                )
+
+    @property
+    def feature_specs_in(self) -> List[FeatureSpec]:
+        return self._replicas[0].deployment.feature_specs_in
+
+    @property
+    def feature_specs_out(self) -> List[FeatureSpec]:
+        return self._replicas[0].deployment.feature_specs_out
+
+    def _acquire(self, tried: Sequence[_Replica] = ()) -> _Replica:
+        """Picks the available replica with the fewest outstanding requests
+
+        Replicas in `tried` are only picked if no other replica is available.
+        If every replica is ejected the one returning first is used, so that
+        predictions are never blocked entirely.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [
+                replica for replica in self._replicas
+                if replica.ejected_until <= now
+            ]
+            untried = [
+                replica for replica in available if replica not in tried
+            ]
+            available = untried or available
+            if available:
+                fewest = min(replica.outstanding for replica in available)
+                replica = random.choice([
+                    replica for replica in available
+                    if replica.outstanding == fewest
+                ])
+            else:
+                replica = min(
+                    self._replicas, key=lambda r: r.ejected_until)
+            replica.outstanding += 1
+            return replica
+
+    def _release(self, replica: _Replica, failed: bool) -> None:
+        with self._lock:
+            replica.outstanding -= 1
+            if not failed:
+                replica.failures = 0
+                return
+            replica.failures += 1
+            if replica.failures >= self._max_failures:
+                replica.ejected_until = time.monotonic() + self._ejection_time
+
+    def _send(self,
+              encoded: PredictData,
+              tried: List[_Replica]) -> List[DataItem]:
+        replica = self._acquire(tried)
+        tried.append(replica)
+        try:
+            predictions = replica.deployment._predict_encoded(encoded)
+        except requests.HTTPError as error:
+            # Client errors are caused by the batch, not by the replica
+            self._release(replica, _replica_error(error))
+            raise
+        except Exception:
+            self._release(replica, True)
+            raise
+        self._release(replica, False)
+        return predictions
+
+    def _predict_batch(self, batch: List[DataItem]) -> List[DataItem]:
+        encoded = self._replicas[0].deployment._encode_batch(batch)
+        tried = []  # type: List[_Replica]
+        for _ in range(len(self._replicas) - 1):
+            try:
+                return self._send(encoded, tried)
+            except requests.HTTPError as error:
+                if not _replica_error(error):
+                    raise
+            except requests.RequestException:
+                pass  # Retry on another replica
+        return self._send(encoded, tried)
+
+    def predict_lazy(self, items: Iterable[DataItem]) -> \
+            Generator[DataItem, None, None]:
+        """Lazily predicts items with batches spread over the replicas"""
+        max_in_flight = self._max_in_flight * len(self._replicas)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            for predictions in bounded_map(
+                    self._predict_batch,
+                    batches(items, self.BATCH_SIZE),
+                    pool,
+                    max_in_flight):
+                yield from predictions
+
+    def predict_unordered(self, items: Iterable[DataItem]) -> \
+            Generator[Tuple[int, DataItem], None, None]:
+        """Lazily predicts items, yielding pairs of item position and
+        prediction as batches complete"""
+        max_in_flight = self._max_in_flight * len(self._replicas)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            for index, predictions in unordered_map(
+                    self._predict_batch,
+                    batches(items, self.BATCH_SIZE),
+                    pool,
+                    max_in_flight):
+                start = index * self.BATCH_SIZE
+                for offset, prediction in enumerate(predictions):
+                    yield start + offset, prediction
+
+    def predict_many(self, items: Iterable[DataItem]) -> List[DataItem]:
+        return list(self.predict_lazy(items))
+
+    def predict(self, **item) -> DataItem:
+        return self._predict_batch([item])[0]
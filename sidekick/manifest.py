@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .atomic import write_json
+
+_HASH_CHUNK_SIZE = 2 ** 20
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open('rb') as file:
+        chunk = file.read(_HASH_CHUNK_SIZE)
+        while chunk:
+            digest.update(chunk)
+            chunk = file.read(_HASH_CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+class UploadManifest:
+    """Local record of the files uploaded to each dataset wrapper
+
+    Uploads are keyed by the sha256 of the file content and hold the upload
+    id and the last known status, so that files already uploaded to a
+    wrapper are not uploaded again. Hashes are cached by path, size and
+    modification time, so unchanged files are only hashed once.
+
+    Args:
+        path: Json file holding the manifest, read if it exists
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {'hashes': {}, 'wrappers': {}}  # type: Dict[str, Any]
+        if path.exists():
+            with path.open() as file:
+                self._data = json.load(file)
+
+    def file_hash(self, path: Path) -> str:
+        stat = path.stat()
+        key = [stat.st_size, stat.st_mtime]
+        with self._lock:
+            cached = self._data['hashes'].get(str(path))
+        if cached is not None and cached['key'] == key:
+            return cached['sha256']
+        digest = file_sha256(path)
+        with self._lock:
+            self._data['hashes'][str(path)] = {'key': key, 'sha256': digest}
+            self._save()
+        return digest
+
+    def find(self, wrapper_id: str, digest: str) -> Optional[Dict[str, Any]]:
+        """Returns the upload of a file content to a wrapper, if any"""
+        with self._lock:
+            return self._data['wrappers'].get(wrapper_id, {}).get(digest)
+
+    def record(self, wrapper_id: str, digest: str, path: Path,
+               upload_id: str, status: str) -> None:
+        with self._lock:
+            uploads = self._data['wrappers'].setdefault(wrapper_id, {})
+            uploads[digest] = {
+                'path': str(path),
+                'uploadId': upload_id,
+                'status': status,
+            }
+            self._save()
+
+    def set_statuses(self, wrapper_id: str, statuses: Dict[str, str]) \
+            -> None:
+        """Updates the statuses of uploads by upload id"""
+        if not statuses:
+            return
+        with self._lock:
+            uploads = self._data['wrappers'].get(wrapper_id, {})
+            for upload in uploads.values():
+                upload['status'] = statuses.get(
+                    upload['uploadId'], upload['status'])
+            self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json(self.path, self._data)
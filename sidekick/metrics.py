@@ -0,0 +1,287 @@
+import collections
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class BatchTiming:
+    """Timings and sizes of a single prediction batch
+
+    Attributes:
+        batch_size: Number of items in the batch
+        encode_time: Seconds spent encoding and serializing the batch
+        request_time: Seconds spent waiting on the deployment, including
+                      retries and their backoff
+        parse_time: Seconds spent parsing the json response
+        decode_time: Seconds spent decoding the predictions
+        request_bytes: Size of the request body
+        response_bytes: Size of the response body
+        retries: Number of retried requests
+    """
+
+    def __init__(self, batch_size: int) -> None:
+        self.batch_size = batch_size
+        self.encode_time = 0.0
+        self.request_time = 0.0
+        self.parse_time = 0.0
+        self.decode_time = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+
+    @property
+    def total_time(self) -> float:
+        return (self.encode_time + self.request_time + self.parse_time +
+                self.decode_time)
+
+    def __repr__(self):
+        return (
+            'BatchTiming(batch_size=%i, encode_time=%.4f, request_time=%.4f, '
+            'parse_time=%.4f, decode_time=%.4f, request_bytes=%i, '
+            'response_bytes=%i, retries=%i)'
+            % (self.batch_size, self.encode_time, self.request_time,
+               self.parse_time, self.decode_time, self.request_bytes,
+               self.response_bytes, self.retries)
+        )
+
+
+class LatencyHistogram:
+    """Rolling window of latencies with percentile lookup
+
+    Args:
+        window: Number of most recent latencies to keep
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self._latencies = collections.deque(maxlen=window)  # type: ignore
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def add(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def values(self) -> List[float]:
+        with self._lock:
+            return list(self._latencies)
+
+    def percentile(self, percent: float) -> float:
+        """Returns the nearest-rank percentile, NaN if nothing is recorded"""
+        if not 0 <= percent <= 100:
+            raise ValueError('Percentile must be in [0, 100], got: %s'
+                             % percent)
+        latencies = sorted(self.values())
+        if not latencies:
+            return math.nan
+        rank = max(math.ceil(percent / 100 * len(latencies)), 1)
+        return latencies[rank - 1]
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(50)
+
+    @property
+    def p95(self) -> float:
+        return self.percentile(95)
+
+    @property
+    def p99(self) -> float:
+        return self.percentile(99)
+
+    def __repr__(self):
+        return (
+            'LatencyHistogram(count=%i, p50=%.4f, p95=%.4f, p99=%.4f)'
+            % (len(self), self.p50, self.p95, self.p99)
+        )
+
+
+class FileProgress:
+    """Upload progress of a single file
+
+    Attributes:
+        total_bytes: Size of the file
+        sent_bytes: Bytes sent, including resent bytes
+        skipped_bytes: Bytes not sent because they were uploaded before
+        started: Clock time of the first sent bytes
+        finished: Clock time the upload was confirmed
+        window: Seconds over which the current throughput is measured
+    """
+
+    def __init__(self, total_bytes: int, window: float = 5.0) -> None:
+        self.total_bytes = total_bytes
+        self.sent_bytes = 0
+        self.skipped_bytes = 0
+        self.started = None  # type: Optional[float]
+        self.finished = None  # type: Optional[float]
+        self.window = window
+        self._recent = collections.deque()  # type: collections.deque
+
+    def add(self, now: float, nbytes: int) -> None:
+        if self.started is None:
+            self.started = now
+        self.sent_bytes += nbytes
+        self._recent.append((now, nbytes))
+        while self._recent and self._recent[0][0] < now - self.window:
+            self._recent.popleft()
+
+    @property
+    def done_bytes(self) -> int:
+        return min(self.sent_bytes + self.skipped_bytes, self.total_bytes)
+
+    def elapsed(self, now: float) -> float:
+        if self.started is None:
+            return 0.0
+        return (now if self.finished is None else self.finished) - \
+            self.started
+
+    def throughput(self, now: float) -> float:
+        """Average bytes sent per second"""
+        elapsed = self.elapsed(now)
+        return self.sent_bytes / elapsed if elapsed > 0 else 0.0
+
+    def current_throughput(self, now: float) -> float:
+        """Bytes sent per second over the last `window` seconds"""
+        if self.started is None or self.finished is not None:
+            return 0.0
+        # Copied as the deque may be appended to by the uploading thread
+        sent = sum(nbytes for sent_at, nbytes in list(self._recent)
+                   if sent_at >= now - self.window)
+        span = min(self.window, now - self.started)
+        return sent / span if span > 0 else 0.0
+
+    def eta(self, now: float) -> Optional[float]:
+        """Estimated seconds until the file is sent, None if unknown"""
+        remaining = self.total_bytes - self.done_bytes
+        if remaining <= 0 or self.finished is not None:
+            return 0.0
+        throughput = self.current_throughput(now) or self.throughput(now)
+        return remaining / throughput if throughput > 0 else None
+
+
+class UploadStats:
+    """Byte level progress and throughput of an upload
+
+    Callbacks receive the stats while bytes are sent, at most once per
+    `interval` seconds, and once more when the upload is closed.
+
+    Args:
+        sizes: Size of each file to upload by path
+        callbacks: Functions called with the stats on progress
+        interval: Minimum seconds between callbacks
+        window: Seconds over which the current throughput is measured
+        clock: Monotonic clock returning seconds
+    """
+
+    def __init__(self,
+                 sizes: Dict[str, int],
+                 callbacks: Sequence[Callable[['UploadStats'], None]] = (),
+                 interval: float = 0.5,
+                 window: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.files = {
+            path: FileProgress(size, window) for path, size in sizes.items()
+        }
+        self._callbacks = list(callbacks)
+        self._interval = interval
+        self._window = window
+        self._clock = clock
+        self._started = clock()
+        self._closed = None  # type: Optional[float]
+        self._notified = -math.inf
+        self._recent = collections.deque()  # type: collections.deque
+        self._lock = threading.Lock()
+        self._notify_lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(file.total_bytes for file in self.files.values())
+
+    @property
+    def sent_bytes(self) -> int:
+        return sum(file.sent_bytes for file in self.files.values())
+
+    @property
+    def done_bytes(self) -> int:
+        """Bytes sent or skipped, excluding resent bytes"""
+        return sum(file.done_bytes for file in self.files.values())
+
+    @property
+    def elapsed(self) -> float:
+        end = self._clock() if self._closed is None else self._closed
+        return end - self._started
+
+    @property
+    def throughput(self) -> float:
+        """Average bytes sent per second since the upload started"""
+        elapsed = self.elapsed
+        return self.sent_bytes / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def current_throughput(self) -> float:
+        """Bytes sent per second over the last `window` seconds"""
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            sent = sum(nbytes for _, nbytes in self._recent)
+        span = min(self._window, now - self._started)
+        return sent / span if span > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds until all bytes are sent, None if unknown"""
+        remaining = self.total_bytes - self.done_bytes
+        if remaining <= 0:
+            return 0.0
+        throughput = self.current_throughput or self.throughput
+        return remaining / throughput if throughput > 0 else None
+
+    def _expire(self, now: float) -> None:
+        while self._recent and self._recent[0][0] < now - self._window:
+            self._recent.popleft()
+
+    def add(self, path: str, nbytes: int) -> None:
+        """Records bytes sent of a file"""
+        now = self._clock()
+        with self._lock:
+            self.files[path].add(now, nbytes)
+            self._recent.append((now, nbytes))
+            self._expire(now)
+        self._notify(now)
+
+    def skip(self, path: str, nbytes: int) -> None:
+        """Records bytes of a file which were uploaded before"""
+        with self._lock:
+            self.files[path].skipped_bytes += nbytes
+        self._notify(self._clock())
+
+    def finish(self, path: str) -> None:
+        with self._lock:
+            file = self.files[path]
+            file.finished = self._clock()
+            if file.started is None:
+                file.started = file.finished
+
+    def close(self) -> None:
+        self._closed = self._clock()
+        self._notify(self._closed, force=True)
+
+    def _notify(self, now: float, force: bool = False) -> None:
+        with self._notify_lock:
+            if not force and now - self._notified < self._interval:
+                return
+            self._notified = now
+            for callback in self._callbacks:
+                callback(self)
+
+    def __repr__(self):
+        eta = self.eta
+        return (
+            'UploadStats(done_bytes=%i, total_bytes=%i, elapsed=%.1f, '
+            'throughput=%.0f, current_throughput=%.0f, eta=%s)'
+            % (self.done_bytes, self.total_bytes, self.elapsed,
+               self.throughput, self.current_throughput,
+               'unknown' if eta is None else '%.1f' % eta)
+        )
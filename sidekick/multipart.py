@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .atomic import write_json
+
+DEFAULT_PART_SIZE = 64 * 2 ** 20
+
+
+def part_ranges(size: int, part_size: int) -> List[Tuple[int, int, int]]:
+    """Returns part number, offset and length of each part of a file
+
+    Part numbers start at 1. An empty file consists of a single empty part.
+    """
+    if part_size <= 0:
+        raise ValueError('Part size must be positive, got: %s' % part_size)
+    offsets = range(0, max(size, 1), part_size)
+    return [
+        (number, offset, min(part_size, size - offset))
+        for number, offset in enumerate(offsets, 1)
+    ]
+
+
+def read_part(path: Path, offset: int, length: int) -> bytes:
+    with path.open('rb') as file:
+        file.seek(offset)
+        return file.read(length)
+
+
+def content_md5(data: bytes) -> Tuple[str, str]:
+    """Returns the hex digest and the base64 `Content-MD5` header value"""
+    digest = hashlib.md5(data)
+    return (digest.hexdigest(),
+            base64.b64encode(digest.digest()).decode())
+
+
+class UploadState:
+    """Progress of uploads, stored in a local json file
+
+    The state records the dataset wrapper and, for each file, the upload
+    and, for multipart uploads, the checksums of its finished parts, so
+    that an interrupted upload resumes with the missing files and parts.
+    Files uploaded in a single request have no part size. A file modified
+    since is uploaded from scratch. Without a path, the state is kept in
+    memory only.
+
+    Args:
+        path: Json file holding the state, read if it exists
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {'wrapperId': None, 'files': {}}  # type: Dict[str, Any]
+        if path is not None and path.exists():
+            with path.open() as file:
+                self._data = json.load(file)
+
+    @property
+    def wrapper_id(self) -> Optional[str]:
+        return self._data['wrapperId']
+
+    @wrapper_id.setter
+    def wrapper_id(self, wrapper_id: str) -> None:
+        with self._lock:
+            self._data['wrapperId'] = wrapper_id
+            self._save()
+
+    def file(self, path: Path, part_size: Optional[int]) \
+            -> Dict[str, Any]:
+        """Returns the state of a file, reset if the file changed"""
+        stat = path.stat()
+        with self._lock:
+            entry = self._data['files'].get(str(path))
+            if (entry is None or entry['size'] != stat.st_size or
+                    entry['mtime'] != stat.st_mtime or
+                    entry['partSize'] != part_size):
+                entry = {
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'partSize': part_size,
+                    'uploadId': None,
+                    'parts': {},
+                    'completed': False,
+                }
+                self._data['files'][str(path)] = entry
+            return entry
+
+    def update(self, path: Path, **values: Any) -> None:
+        with self._lock:
+            self._data['files'][str(path)].update(values)
+            self._save()
+
+    def discard(self, path: Path) -> None:
+        """Forgets the upload of a file, e.g. after saving it failed"""
+        with self._lock:
+            self._data['files'].pop(str(path), None)
+            self._save()
+
+    def add_part(self, path: Path, number: int, checksum: str) -> None:
+        with self._lock:
+            self._data['files'][str(path)]['parts'][str(number)] = checksum
+            self._save()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        write_json(self.path, self._data)
+
+    def remove(self) -> None:
+        """Removes the state file once the upload is complete"""
+        if self.path is not None and self.path.exists():
+            self.path.unlink()
@@ -0,0 +1,207 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """Thread safe token bucket
+
+    Tokens are added at `rate` per second up to `capacity`. Acquiring more
+    tokens than available reserves them ahead, the caller then sleeps until
+    they would have been added. Callers are therefore served in order and a
+    request larger than the capacity is delayed instead of blocked forever.
+    Changing the rate scales the capacity along, so a lowered rate also
+    allows smaller bursts.
+
+    Args:
+        rate: Tokens added per second
+        capacity: Largest burst, defaults to one second of tokens
+        clock: Monotonic clock returning seconds
+        sleep: Function sleeping the given number of seconds
+    """
+
+    def __init__(self,
+                 rate: float,
+                 capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        if rate <= 0:
+            raise ValueError('Rate must be positive, got: %s' % rate)
+        self._rate = float(rate)
+        self._capacity = float(rate if capacity is None else capacity)
+        self._burst = self._capacity / self._rate
+        self._tokens = self._capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError('Rate must be positive, got: %s' % rate)
+        with self._lock:
+            self._refill()
+            self._rate = float(rate)
+            self._capacity = self._burst * self._rate
+            self._tokens = min(self._tokens, self._capacity)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Takes tokens and returns the seconds to wait before using them"""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Blocks until tokens are available and returns the seconds waited"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            self._sleep(delay)
+        return delay
+
+
+class RateLimiter:
+    """Adaptive limit of requests and items per second
+
+    A limiter may be shared by several deployments, e.g. all deployments
+    counting towards the same quota. Rates start at the given maximum. Every
+    429 response halves them, down to `min_fraction` of the maximum, and a
+    `Retry-After` pauses every caller for the given time. Each successful
+    response adds `increase` of the maximum back, up to `headroom` times the
+    rate at which the last run of 429 responses started. The rates therefore
+    settle just below the quota instead of oscillating around it. After
+    `probe_interval` seconds at that ceiling without a 429, the ceiling is
+    raised by the same factor, so the rates recover when the quota does.
+
+    Args:
+        requests_per_second: Maximum number of requests per second
+        items_per_second: Maximum number of predicted items per second
+        increase: Fraction of the maximum rate added per success
+        decrease: Factor applied to the rates per rate limited response
+        min_fraction: Lowest fraction of the maximum rate
+        headroom: Fraction of the rate limited rate the rates recover to
+        probe_interval: Seconds without 429 responses after which the
+                        ceiling is raised
+        clock: Monotonic clock returning seconds
+        sleep: Function sleeping the given number of seconds
+    """
+
+    def __init__(self,
+                 requests_per_second: Optional[float] = None,
+                 items_per_second: Optional[float] = None,
+                 increase: float = 0.02,
+                 decrease: float = 0.5,
+                 min_fraction: float = 0.05,
+                 headroom: float = 0.9,
+                 probe_interval: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        if requests_per_second is None and items_per_second is None:
+            raise ValueError('Requests or items per second is required')
+        self._max_requests = requests_per_second
+        self._max_items = items_per_second
+        self._requests = None if requests_per_second is None \
+            else TokenBucket(requests_per_second, clock=clock, sleep=sleep)
+        self._items = None if items_per_second is None \
+            else TokenBucket(items_per_second, clock=clock, sleep=sleep)
+        self._fraction = 1.0
+        self._increase = increase
+        self._decrease = decrease
+        self._min_fraction = min_fraction
+        self._headroom = headroom
+        self._probe_interval = probe_interval
+        # Highest fraction the rates recover to, when it last changed and
+        # whether the last response was rate limited
+        self._ceiling = 1.0
+        self._ceiling_changed = clock()
+        self._limited = False
+        self._clock = clock
+        self._sleep = sleep
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def fraction(self) -> float:
+        """Current rates as a fraction of the maximum rates"""
+        return self._fraction
+
+    @property
+    def requests_per_second(self) -> Optional[float]:
+        return None if self._requests is None else self._requests.rate
+
+    @property
+    def items_per_second(self) -> Optional[float]:
+        return None if self._items is None else self._items.rate
+
+    def acquire(self, items: int = 1) -> float:
+        """Blocks until a request of `items` may be sent
+
+        Returns:
+            Seconds waited
+        """
+        waited = 0.0
+        pause = self._paused_until - self._clock()
+        if pause > 0:
+            self._sleep(pause)
+            waited += pause
+        delays = [0.0]
+        if self._requests is not None:
+            delays.append(self._requests.reserve(1))
+        if self._items is not None:
+            delays.append(self._items.reserve(items))
+        delay = max(delays)
+        if delay > 0:
+            self._sleep(delay)
+        return waited + delay
+
+    def record(self, status_code: int,
+               retry_after: Optional[float] = None) -> None:
+        """Adapts the rates to the status of a response
+
+        Args:
+            status_code: Status code of the response
+            retry_after: Seconds of the response's `Retry-After` header
+        """
+        with self._lock:
+            if status_code == 429:
+                # Consecutive 429s, e.g. of concurrent requests, are caused
+                # by the rate before the first of them
+                if not self._limited:
+                    self._ceiling = max(self._fraction * self._headroom,
+                                        self._min_fraction)
+                    self._ceiling_changed = self._clock()
+                self._limited = True
+                self._fraction = max(
+                    self._fraction * self._decrease, self._min_fraction)
+                if retry_after is not None:
+                    self._paused_until = max(
+                        self._paused_until, self._clock() + retry_after)
+            elif status_code < 400:
+                self._limited = False
+                now = self._clock()
+                if (self._fraction >= self._ceiling and
+                        now - self._ceiling_changed >= self._probe_interval):
+                    self._ceiling = min(self._ceiling / self._headroom, 1.0)
+                    self._ceiling_changed = now
+                self._fraction = min(self._fraction + self._increase,
+                                     self._ceiling)
+            else:
+                return
+            fraction = self._fraction
+        if self._requests is not None and self._max_requests is not None:
+            self._requests.rate = self._max_requests * fraction
+        if self._items is not None and self._max_items is not None:
+            self._items.rate = self._max_items * fraction
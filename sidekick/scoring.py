@@ -0,0 +1,281 @@
+import csv
+import io
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import (IO, Any, Dict, Iterable, Iterator, List, Optional,
+                    Sequence, Union)
+
+import pandas as pd
+
+from .atomic import write_json
+from .deployment import Deployment, batches, bounded_map, prediction_rows
+from .metrics import BatchTiming
+
+PathLike = Union[str, Path]
+
+_TEXT_DTYPES = frozenset({'text'})
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class Checkpoint:
+    """Progress of a scoring run, used to resume an interrupted run
+
+    Args:
+        input_path: File being scored
+        rows: Number of input rows written to the output
+        offset: Size of the output file after the last written batch
+    """
+
+    def __init__(self, input_path: str, rows: int = 0, offset: int = 0) \
+            -> None:
+        self.input_path = input_path
+        self.rows = rows
+        self.offset = offset
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'input_path': self.input_path,
+            'rows': self.rows,
+            'offset': self.offset,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Checkpoint':
+        return cls(data['input_path'], data['rows'], data['offset'])
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['Checkpoint']:
+        try:
+            with path.open() as file:
+                return cls.from_dict(json.load(file))
+        except FileNotFoundError:
+            return None
+
+    def save(self, path: Path) -> None:
+        """Atomically replaces the checkpoint file"""
+        write_json(path, self.to_dict())
+
+
+def read_rows(path: PathLike,
+              path_columns: Sequence[str] = (),
+              skip_rows: int = 0,
+              chunk_size: int = 10000,
+              dtype: Optional[Dict[str, Any]] = None,
+              required_columns: Sequence[str] = ()) \
+        -> Iterator[Dict[str, Any]]:
+    """Lazily reads the rows of a CSV or Parquet file
+
+    Files are read `chunk_size` rows at a time. Values of `path_columns` are
+    turned into paths, relative paths are resolved against the directory of
+    the input file. The files are only read when the rows are encoded.
+    Empty cells of CSV columns parsed as `str` are read as empty strings.
+
+    Args:
+        path: CSV file or, if pyarrow is installed, Parquet file
+        path_columns: Columns holding paths to images or numpy files
+        skip_rows: Number of leading rows to skip
+        chunk_size: Number of rows read at a time
+        dtype: Column types used when parsing a CSV file
+        required_columns: Columns which must not have missing values
+
+    Returns:
+        Iterator of rows as dicts
+
+    Raises:
+        ValueError: A required column is missing a value
+    """
+    path = Path(path)
+    if path.suffix == '.parquet':
+        frames = _read_parquet(path, chunk_size)
+        rows = islice(
+            _frame_rows(frames), skip_rows,
+            None)  # type: Iterator[Dict[str, Any]]
+    else:
+        frames = pd.read_csv(str(path),
+                             chunksize=chunk_size,
+                             skiprows=range(1, skip_rows + 1),
+                             dtype=dtype)
+        # Pandas reads empty cells as NaN regardless of the column type
+        text_columns = {
+            column: '' for column, kind in (dtype or {}).items()
+            if kind is str
+        }
+        rows = _frame_rows(frame.fillna(text_columns) for frame in frames)
+
+    for number, row in enumerate(rows, skip_rows + 1):
+        for column in required_columns:
+            if _is_missing(row[column]):
+                raise ValueError('Missing value for %s in row %i of %s'
+                                 % (column, number, path))
+        for column in path_columns:
+            row[column] = path.parent / row[column]
+        yield row
+
+
+def _read_parquet(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Reading Parquet files requires pyarrow, install '
+                          'it with: pip install sidekick[parquet]')
+    for batch in pq.ParquetFile(str(path)).iter_batches(chunk_size):
+        yield batch.to_pandas()
+
+
+def _frame_rows(frames: Iterable[pd.DataFrame]) \
+        -> Iterator[Dict[str, Any]]:
+    for frame in frames:
+        yield from frame.to_dict('records')
+
+
+class _OutputWriter:
+    """Appends encoded predictions to a CSV or JSON lines file
+
+    Values are written as returned by the deployment, binary features remain
+    base64 encoded data urls and arrays remain lists.
+    """
+
+    def __init__(self, file: IO[bytes], path: Path, columns: List[str]) \
+            -> None:
+        self._file = file
+        self._columns = columns
+        self._csv = path.suffix == '.csv'
+        if self._csv and file.tell() == 0:
+            self._write_csv([dict(zip(columns, columns))])
+
+    def write(self, rows: List[Dict[str, Any]]) -> int:
+        """Writes and flushes rows, returns the new size of the file"""
+        if self._csv:
+            self._write_csv(rows)
+        else:
+            self._file.write(b''.join(
+                json.dumps({column: row[column] for column in self._columns},
+                           default=str)
+                .encode() + b'\n'
+                for row in rows
+            ))
+        self._file.flush()
+        return self._file.tell()
+
+    def _write_csv(self, rows: List[Dict[str, Any]]) -> None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                '' if value is None
+                else value if isinstance(value, (str, int, float))
+                else json.dumps(value, default=str)
+                for value in (row[column] for column in self._columns)
+            ])
+        self._file.write(buffer.getvalue().encode())
+
+
+def score_file(deployment: Deployment,
+               input_path: PathLike,
+               output_path: PathLike,
+               path_columns: Sequence[str] = (),
+               keep_columns: Sequence[str] = (),
+               max_in_flight: int = 4,
+               chunk_size: int = 10000,
+               checkpoint_path: Optional[PathLike] = None) -> int:
+    """Predicts every row of a file and writes the predictions to a file
+
+    Rows are streamed from the input through the deployment to the output,
+    at most `max_in_flight` batches are in memory or in flight at any time.
+    Predictions are written in input order. After each batch the number of
+    completed rows is stored in a checkpoint file, and running again with the
+    same arguments resumes after the last completed batch. The checkpoint is
+    removed once every row is written. Empty text cells are predicted as
+    empty strings, other missing input values raise a `ValueError`.
+    Deployments with categorical input features are not supported.
+
+    Args:
+        deployment: Deployment to predict with
+        input_path: CSV or Parquet file with a column per input feature
+        output_path: File to write, `.csv` or JSON lines for any other suffix
+        path_columns: Columns holding paths to images or numpy files
+        keep_columns: Input columns copied to the output, e.g. an id
+        max_in_flight: Number of concurrent requests
+        chunk_size: Number of rows read from the input at a time
+        checkpoint_path: Defaults to the output path with `.checkpoint`
+                         appended
+
+    Returns:
+        Number of rows predicted by this run
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    if checkpoint_path is None:
+        checkpoint_path = output_path.with_name(
+            output_path.name + '.checkpoint')
+    checkpoint_path = Path(checkpoint_path)
+
+    checkpoint = Checkpoint.load(checkpoint_path)
+    if checkpoint is None:
+        checkpoint = Checkpoint(str(input_path))
+    elif checkpoint.input_path != str(input_path):
+        raise ValueError('Checkpoint %s belongs to %s'
+                         % (checkpoint_path, checkpoint.input_path))
+
+    specs_in = deployment.feature_specs_in
+    # Categorical inputs are dicts of category values, which a single
+    # table cell does not hold
+    categorical = [spec.name for spec in specs_in
+                   if spec.dtype == 'categorical']
+    if categorical:
+        raise ValueError('Categorical input features are not supported: %s'
+                         % ', '.join(categorical))
+    names_out = [spec.name for spec in deployment.feature_specs_out]
+    dtype = {
+        spec.name: str for spec in specs_in
+        if spec.dtype in _TEXT_DTYPES and spec.name not in path_columns
+    }
+    # Columns only passed through are written back exactly as they were read
+    names_in = {spec.name for spec in specs_in}
+    dtype.update(
+        (column, str) for column in keep_columns if column not in names_in)
+    rows = read_rows(input_path, path_columns, checkpoint.rows, chunk_size,
+                     dtype, [spec.name for spec in specs_in])
+
+    def predict(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        timing = BatchTiming(len(batch))
+        encoded = deployment._encode_batch(batch, timing)
+        predictions = prediction_rows(
+            deployment._request(encoded, timing, retry=True))
+        if len(predictions) != len(batch):
+            raise ValueError('Expected %i predictions, got: %i'
+                             % (len(batch), len(predictions)))
+        deployment._record(timing)
+        for item, prediction in zip(batch, predictions):
+            for column in keep_columns:
+                value = item[column]
+                prediction[column] = None if _is_missing(value) else value
+        return predictions
+
+    mode = 'r+b' if checkpoint.rows else 'wb'
+    scored = 0
+    with output_path.open(mode) as file:
+        file.truncate(checkpoint.offset)
+        file.seek(checkpoint.offset)
+        writer = _OutputWriter(
+            file, output_path, list(keep_columns) + names_out)
+        checkpoint.offset = file.tell()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            for predictions in bounded_map(
+                    predict,
+                    batches(rows, deployment.BATCH_SIZE),
+                    pool,
+                    max_in_flight):
+                checkpoint.offset = writer.write(predictions)
+                checkpoint.rows += len(predictions)
+                scored += len(predictions)
+                checkpoint.save(checkpoint_path)
+
+    if checkpoint_path.exists():
+        checkpoint_path.unlink()
+    return scored
@@ -0,0 +1,135 @@
+import abc
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .atomic import write_json
+from .data_models import FeatureSpec
+
+
+class DeploymentSpecs:
+    """Parsed feature specifications of a deployment
+
+    Args:
+        feature_specs_in: Specifications of the input features
+        feature_specs_out: Specifications of the output features
+        etag: ETag returned with the OpenAPI specification, if any
+        fetched_at: Unix time at which the specification was last validated
+    """
+
+    def __init__(self,
+                 feature_specs_in: List[FeatureSpec],
+                 feature_specs_out: List[FeatureSpec],
+                 etag: Optional[str] = None,
+                 fetched_at: Optional[float] = None) -> None:
+        self.feature_specs_in = feature_specs_in
+        self.feature_specs_out = feature_specs_out
+        self.etag = etag
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def revalidated(self) -> 'DeploymentSpecs':
+        """Returns a copy marked as validated now"""
+        return DeploymentSpecs(
+            self.feature_specs_in, self.feature_specs_out, etag=self.etag)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'featureSpecsIn': [
+                spec.to_dict() for spec in self.feature_specs_in
+            ],
+            'featureSpecsOut': [
+                spec.to_dict() for spec in self.feature_specs_out
+            ],
+            'etag': self.etag,
+            'fetchedAt': self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DeploymentSpecs':
+        return cls(
+            feature_specs_in=[
+                FeatureSpec.from_dict(spec) for spec in data['featureSpecsIn']
+            ],
+            feature_specs_out=[
+                FeatureSpec.from_dict(spec) for spec in data['featureSpecsOut']
+            ],
+            etag=data.get('etag'),
+            fetched_at=data.get('fetchedAt'),
+        )
+
+
+class SpecCache(abc.ABC):
+    """Cache of deployment specifications keyed by OpenAPI url
+
+    Entries younger than `max_age` seconds are used as is. Older entries are
+    revalidated against the deployment with an `If-None-Match` request, which
+    avoids downloading and parsing the specification if it is unchanged.
+
+    Args:
+        max_age: Seconds an entry is trusted without revalidation
+    """
+
+    def __init__(self, max_age: float = 0.0) -> None:
+        self.max_age = max_age
+
+    def is_fresh(self, specs: DeploymentSpecs) -> bool:
+        return time.time() - specs.fetched_at < self.max_age
+
+    @abc.abstractmethod
+    def get(self, url: str) -> Optional[DeploymentSpecs]:
+        pass
+
+    @abc.abstractmethod
+    def set(self, url: str, specs: DeploymentSpecs) -> None:
+        pass
+
+
+class MemorySpecCache(SpecCache):
+    """Spec cache kept in memory, e.g. shared between deployments"""
+
+    def __init__(self, max_age: float = 0.0) -> None:
+        super().__init__(max_age)
+        self._entries = dict()  # type: Dict[str, DeploymentSpecs]
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[DeploymentSpecs]:
+        with self._lock:
+            return self._entries.get(url)
+
+    def set(self, url: str, specs: DeploymentSpecs) -> None:
+        with self._lock:
+            self._entries[url] = specs
+
+
+class FileSpecCache(SpecCache):
+    """Spec cache stored as json files in a directory
+
+    Files are replaced atomically, so the directory may be shared between
+    processes.
+
+    Args:
+        directory: Directory to store cached specifications in
+        max_age: Seconds an entry is trusted without revalidation
+    """
+
+    def __init__(self, directory: str, max_age: float = 0.0) -> None:
+        super().__init__(max_age)
+        self.directory = Path(str(directory))
+
+    def _path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / ('%s.json' % digest)
+
+    def get(self, url: str) -> Optional[DeploymentSpecs]:
+        try:
+            with self._path(url).open() as file:
+                return DeploymentSpecs.from_dict(json.load(file))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, url: str, specs: DeploymentSpecs) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_json(self._path(url), specs.to_dict())
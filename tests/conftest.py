@@ -0,0 +1,46 @@
+import json
+from typing import List
+
+import pytest
+import responses
+from mock_specs import mock_api_specs
+
+from sidekick.data_models import FeatureSpec
+
+
+@pytest.fixture
+def mock_deployment():
+    """Mocks the endpoints of deployments
+
+    Returns a function adding the specs of a deployment and, if `forward` is
+    given, its forward endpoint, and returning the forward url. `forward` is
+    called with the rows of each request and returns the output rows, or a
+    tuple of status, headers and body. Other keyword arguments are passed on
+    to the specs response, e.g. `headers`.
+    """
+
+    def add(features_in: List[FeatureSpec],
+            features_out: List[FeatureSpec],
+            forward=None,
+            host: str = 'peltarion.com',
+            **kwargs) -> str:
+        url = 'http://%s/deployment' % host
+        responses.add(
+            responses.GET,
+            url + '/openapi.json',
+            json=mock_api_specs(features_in, features_out),
+            **kwargs
+        )
+        if forward is not None:
+
+            def callback(request):
+                result = forward(json.loads(request.body)['rows'])
+                if isinstance(result, tuple):
+                    return result
+                return 200, {}, json.dumps({'rows': result})
+
+            responses.add_callback(
+                responses.POST, url + '/forward', callback=callback)
+        return url + '/forward'
+
+    return add
@@ -0,0 +1,44 @@
+from typing import List
+
+from sidekick.data_models import FeatureSpec
+
+
+def get_feature(dtype: str, shape: List[int]):
+    return {
+        'extensions': {
+            'x-peltarion': {
+                'type': dtype,
+                'shape': shape,
+            },
+        },
+    }
+
+
+def get_properties(features: List[FeatureSpec]) -> dict:
+    return {
+        feature.name: get_feature(feature.dtype, feature.shape)
+        for feature in features
+    }
+
+
+def mock_api_specs(
+    features_in: List[FeatureSpec],
+    features_out: List[FeatureSpec],
+) -> dict:
+
+    return {
+        'components': {
+            'schemas': {
+                'input-row': {
+                    'properties': get_properties(features_in)
+                },
+                'output-row-batch': {
+                    'properties': {
+                        'rows': {
+                            'properties': get_properties(features_out)
+                        },
+                    },
+                },
+            },
+        },
+    }
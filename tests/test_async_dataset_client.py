@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from sidekick.async_dataset_client import AsyncDatasetClient
+
+
+class FakeDatasetApi:
+    """Minimal stand-in for the Dataset API"""
+
+    def __init__(self, fail: bool = False, hang: bool = False) -> None:
+        self.fail = fail
+        self.hang = hang
+        self.uploads = {}  # type: dict
+        self.polls = 0
+        self.completed = False
+        self.app = web.Application()
+        self.app.router.add_post('/', self.create)
+        self.app.router.add_post('/{wrapper}/upload', self.upload)
+        self.app.router.add_get('/{wrapper}/uploads', self.statuses)
+        self.app.router.add_post('/{wrapper}/upload_complete', self.complete)
+
+    async def create(self, request):
+        assert request.headers['Authorization'] == 'Bearer token'
+        return web.json_response({'datasetWrapperId': 'wrapper'})
+
+    async def upload(self, request):
+        if self.hang and self.uploads:
+            # Later uploads are still running when the first one fails
+            await asyncio.sleep(1)
+        upload_id = 'id%i' % len(self.uploads)
+        self.uploads[upload_id] = (
+            request.headers['Content-Type'], await request.read())
+        return web.json_response({'uploadId': upload_id})
+
+    async def statuses(self, request):
+        self.polls += 1
+        status = 'SUCCESS' if self.polls > 1 else 'PROCESSING'
+        if self.fail:
+            status = 'FAILED'
+        return web.json_response({'uploadStatuses': [
+            {'uploadId': upload_id, 'status': status, 'message': 'mock'}
+            for upload_id in self.uploads
+        ]})
+
+    async def complete(self, request):
+        self.completed = True
+        return web.Response(status=204)
+
+
+def run_upload(api: FakeDatasetApi, filepaths) -> None:
+
+    async def upload():
+        runner = web.AppRunner(api.app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            client = AsyncDatasetClient(
+                url='http://127.0.0.1:%i/' % port, token='token')
+            await client.upload_data(filepaths)
+        finally:
+            await runner.cleanup()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(upload())
+    finally:
+        loop.close()
+
+
+def test_async_upload_data(tmp_path):
+    csv_file = tmp_path / 'data.csv'
+    csv_file.write_text('a,b\n1,2\n')
+    npy_file = tmp_path / 'data.npy'
+    npy_file.write_bytes(b'\x93NUMPY' + b'0' * 100)
+    api = FakeDatasetApi()
+
+    run_upload(api, [csv_file, npy_file])
+
+    assert sorted(api.uploads.values()) == [
+        ('application/npy', npy_file.read_bytes()),
+        ('text/csv', csv_file.read_bytes()),
+    ]
+    assert api.polls == 2
+    assert api.completed
+
+
+def test_async_upload_failed(tmp_path):
+    csv_file = tmp_path / 'data.csv'
+    csv_file.write_text('a,b\n1,2\n')
+    api = FakeDatasetApi(fail=True)
+
+    with pytest.raises(IOError):
+        run_upload(api, [csv_file])
+    assert not api.completed
+
+
+def test_async_upload_failed_waits_for_cancelled_uploads(
+        tmp_path, monkeypatch):
+    paths = [tmp_path / 'large.csv', tmp_path / 'small.csv']
+    paths[0].write_text('a,b\n' + '1,2\n' * 100)
+    paths[1].write_text('a,b\n1,2\n')
+    staged = []  # type: list
+    stage_file = AsyncDatasetClient._stage_file
+
+    async def recording_stage_file(self, session, filepath, *args):
+        try:
+            return await stage_file(self, session, filepath, *args)
+        finally:
+            staged.append((filepath, session.closed))
+
+    monkeypatch.setattr(
+        AsyncDatasetClient, '_stage_file', recording_stage_file)
+
+    with pytest.raises(IOError):
+        run_upload(FakeDatasetApi(fail=True, hang=True), paths)
+    # Uploads end before the session is closed under them
+    assert sorted(staged) == [(path, False) for path in paths]
+
+
+def test_async_upload_invalid_extension(tmp_path):
+    jpeg_file = tmp_path / 'image.jpeg'
+    jpeg_file.write_bytes(b'')
+    with pytest.raises(ValueError):
+        run_upload(FakeDatasetApi(), [jpeg_file])
@@ -0,0 +1,17 @@
+import json
+
+import pytest
+
+from sidekick.atomic import write_json
+
+
+def test_write_json(tmp_path):
+    path = tmp_path / 'data.json'
+    write_json(path, {'a': 1})
+    write_json(path, {'a': 2})
+    assert json.loads(path.read_text()) == {'a': 2}
+
+    with pytest.raises(TypeError):
+        write_json(path, {'a': object()})
+    assert json.loads(path.read_text()) == {'a': 2}
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+import responses
+
+from sidekick import Deployment, PredictionCoalescer
+from sidekick.data_models import FeatureSpec
+
+URL = 'http://peltarion.com/deployment/forward'
+
+
+def add_echo_deployment(mock_deployment, batch_sizes: list) -> None:
+    """Mock deployment doubling its inputs and recording the batch sizes"""
+    features_in = [FeatureSpec('input', 'numeric', (1,))]
+    features_out = [FeatureSpec('output', 'numeric', (1,))]
+
+    def echo(rows):
+        batch_sizes.append(len(rows))
+        return [{'output': row['input'] * 2} for row in rows]
+
+    mock_deployment(features_in, features_out, echo)
+
+
+@responses.activate
+def test_coalescer_batches_concurrent_calls(mock_deployment):
+    batch_sizes = []  # type: list
+    add_echo_deployment(mock_deployment, batch_sizes)
+    deployment = Deployment(url=URL, token='deployment_token')
+
+    num_threads = 20
+    results = [None] * num_threads
+    barrier = threading.Barrier(num_threads)
+
+    def call(coalescer, index):
+        barrier.wait()
+        results[index] = coalescer.predict(input=index)
+
+    with PredictionCoalescer(deployment, window=0.2) as coalescer:
+        threads = [
+            threading.Thread(target=call, args=(coalescer, i))
+            for i in range(num_threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert results == [{'output': i * 2} for i in range(num_threads)]
+    assert sum(batch_sizes) == num_threads
+    assert len(batch_sizes) < num_threads
+
+
+@responses.activate
+def test_coalescer_max_batch_size(mock_deployment):
+    batch_sizes = []  # type: list
+    add_echo_deployment(mock_deployment, batch_sizes)
+    deployment = Deployment(url=URL, token='deployment_token')
+
+    with PredictionCoalescer(deployment, window=1, max_batch_size=3) as c:
+        futures = [c.submit({'input': i}) for i in range(7)]
+        results = [future.result() for future in futures]
+
+    assert results == [{'output': i * 2} for i in range(7)]
+    assert batch_sizes == [3, 3, 1]
+
+
+@responses.activate
+def test_coalescer_errors(mock_deployment):
+    batch_sizes = []  # type: list
+    add_echo_deployment(mock_deployment, batch_sizes)
+    deployment = Deployment(url=URL, token='deployment_token')
+    coalescer = PredictionCoalescer(deployment, window=0)
+
+    # Malformed items raise in the calling thread
+    with pytest.raises(TypeError):
+        coalescer.predict(input='foo')
+    with pytest.raises(ValueError):
+        coalescer.predict(other=1)
+    assert batch_sizes == []
+
+    # Request errors are propagated to every caller in the batch
+    responses.replace(responses.POST, URL, status=500)
+    future = coalescer.submit({'input': 1})
+    with pytest.raises(Exception):
+        future.result()
+
+    coalescer.close()
+    with pytest.raises(RuntimeError):
+        coalescer.predict(input=1)
+
+    with pytest.raises(ValueError):
+        PredictionCoalescer(deployment, window=-1)
+
+
+@responses.activate
+def test_coalescer_cancelled_future(mock_deployment):
+    batch_sizes = []  # type: list
+    add_echo_deployment(mock_deployment, batch_sizes)
+    deployment = Deployment(url=URL, token='deployment_token')
+
+    with PredictionCoalescer(deployment, window=0.2) as coalescer:
+        cancelled = coalescer.submit({'input': 1})
+        future = coalescer.submit({'input': 2})
+        assert cancelled.cancel()
+        assert future.result(timeout=5) == {'output': 4}
+        # The worker keeps serving later calls
+        assert coalescer.submit({'input': 3}).result(timeout=5) == {
+            'output': 6}
+
+    assert batch_sizes == [1, 1]
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+import responses
+
+from sidekick import Deployment
+from sidekick.columnar import (decode_columns, encode_columns, num_rows,
+                               slice_rows)
+from sidekick.data_models import FeatureSpec
+from sidekick.encode import NumpyEncoder, decode_feature, encode_feature
+
+URL = 'http://peltarion.com/deployment/forward'
+FEATURES_IN = [
+    FeatureSpec('number', 'numeric', (1,)),
+    FeatureSpec('array', 'numeric', (2, 3)),
+    FeatureSpec('text', 'text', (10,)),
+]
+
+
+def test_num_rows_and_slice():
+    data = {'a': np.arange(5), 'b': list('abcde')}
+    assert num_rows(data) == 5
+    assert num_rows(pd.DataFrame(data)) == 5
+    assert slice_rows(data, 1, 3)['b'] == ['b', 'c']
+    assert list(slice_rows(pd.DataFrame(data), 1, 3)['a']) == [1, 2]
+
+    with pytest.raises(ValueError):
+        num_rows({'a': np.arange(5), 'b': np.arange(4)})
+
+
+def test_encode_columns_matches_per_item_encoding():
+    arrays = np.random.rand(4, 2, 3)
+    data = {
+        'number': np.arange(4, dtype=np.float64),
+        'array': arrays,
+        'text': ['a', 'b', 'c', 'd'],
+    }
+    rows = encode_columns(data, FEATURES_IN)
+    frame_rows = encode_columns(
+        pd.DataFrame({
+            'number': data['number'],
+            'array': list(arrays),
+            'text': data['text'],
+        }),
+        FEATURES_IN,
+    )
+    assert rows == frame_rows
+    for index, row in enumerate(rows):
+        assert row == {
+            spec.name: encode_feature(
+                data[spec.name][index] if spec.name != 'number'
+                else float(index), spec)
+            for spec in FEATURES_IN
+        }
+
+
+def test_encode_columns_errors():
+    data = {
+        'number': np.arange(4),
+        'array': np.random.rand(4, 2, 3),
+        'text': ['a', 'b', 'c', 'd'],
+    }
+    with pytest.raises(ValueError):
+        encode_columns({'number': data['number']}, FEATURES_IN)
+    with pytest.raises(TypeError):
+        encode_columns(dict(data, number=['a'] * 4), FEATURES_IN)
+    with pytest.raises(ValueError):
+        encode_columns(dict(data, array=np.random.rand(4, 3, 2)), FEATURES_IN)
+    with pytest.raises(TypeError):
+        encode_columns(dict(data, text=[1, 2, 3, 4]), FEATURES_IN)
+
+
+def test_decode_columns():
+    specs = [
+        FeatureSpec('number', 'numeric', (1,)),
+        FeatureSpec('array', 'numeric', (2, 3)),
+        FeatureSpec('category', 'categorical', (2,)),
+    ]
+    arrays = np.random.rand(3, 2, 3).astype(np.float32)
+    rows = [
+        {
+            'number': index,
+            'array': NumpyEncoder().encode_json(arrays[index]),
+            'category': {'a': 0.5, 'b': 0.5},
+        }
+        for index in range(3)
+    ]
+    columns = decode_columns(rows, specs)
+    np.testing.assert_array_equal(columns['number'], [0, 1, 2])
+    np.testing.assert_array_equal(columns['array'], arrays)
+    assert columns['category'].dtype == object
+    assert list(columns['category']) == [
+        decode_feature(row['category'], specs[2]) for row in rows
+    ]
+
+    empty = decode_columns([], specs)
+    assert empty['array'].shape == (0, 2, 3)
+
+
+@responses.activate
+def test_deployment_predict_columns(monkeypatch, mock_deployment):
+    monkeypatch.setattr(Deployment, 'BATCH_SIZE', 3)
+    features_in = [FeatureSpec('input', 'numeric', (1,))]
+    features_out = [
+        FeatureSpec('output', 'numeric', (1,)),
+        FeatureSpec('array', 'numeric', (2,)),
+    ]
+
+    def forward(rows):
+        return [
+            {
+                'output': row['input'] * 2,
+                'array': NumpyEncoder().encode_json(
+                    np.array([row['input'], 0])),
+            }
+            for row in rows
+        ]
+
+    mock_deployment(features_in, features_out, forward)
+    deployment = Deployment(url=URL, token='deployment_token')
+
+    columns = deployment.predict_columns({'input': np.arange(10)})
+    np.testing.assert_array_equal(columns['output'], np.arange(10) * 2)
+    assert columns['array'].shape == (10, 2)
+    np.testing.assert_array_equal(columns['array'][:, 0], np.arange(10))
+    assert len(responses.calls) == 5
+
+    frame = pd.DataFrame({'input': [1.0, 2.0]}, index=['a', 'b'])
+    predictions = deployment.predict_columns(frame)
+    assert isinstance(predictions, pd.DataFrame)
+    assert list(predictions.index) == ['a', 'b']
+    assert list(predictions['output']) == [2.0, 4.0]
+    np.testing.assert_array_equal(predictions.loc['b', 'array'], [2, 0])
+
+    empty = deployment.predict_columns({'input': np.array([])})
+    assert empty['array'].shape == (0, 2)
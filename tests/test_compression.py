@@ -0,0 +1,10 @@
+import gzip
+
+from sidekick.compression import gzip_chunks
+
+
+def test_gzip_chunks():
+    chunks = [b'abc' * 1000, b'', b'def' * 1000]
+    compressed = b''.join(gzip_chunks(iter(chunks), 9))
+    assert gzip.decompress(compressed) == b''.join(chunks)
+    assert len(compressed) < 100
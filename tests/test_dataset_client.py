@@ -1,10 +1,22 @@
+import gzip
+import hashlib
+import io
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile
 
+import pandas as pd
 import pytest
+import requests
 import responses
 from PIL import Image
 
 from sidekick.dataset_client import DatasetClient, Status, UploadJob
+from sidekick.manifest import UploadManifest
+from sidekick.multipart import part_ranges
+from sidekick.ratelimit import TokenBucket
 
 
 @pytest.fixture
@@ -138,8 +150,15 @@ class TestDatasetClient:
             status=204,
         )
 
-        client.upload_data([csv_file, zip_file])
+        reported = []
+        stats = client.upload_data(
+            [csv_file, zip_file], progress_callback=reported.append)
         assert len(responses.calls) == 6
+        total = csv_file.stat().st_size + zip_file.stat().st_size
+        assert stats.total_bytes == stats.sent_bytes == total
+        assert stats.files[str(zip_file)].finished is not None
+        assert stats.eta == 0.0
+        assert reported[-1] is stats
 
     @responses.activate
     def test_failed_upload_job(self, client, csv_file, zip_file):
@@ -185,3 +204,433 @@ class TestDatasetClient:
 
         with pytest.raises(IOError):
             client.upload_data([csv_file, zip_file])
+
+    @responses.activate
+    def test_stage_file_streams_from_disk(self, client, zip_file):
+        wrapper_id = 'wrapper_id'
+        bodies = []
+        post = client._session.post
+
+        def spy_post(**kwargs):
+            # The file is passed on unread instead of its content
+            assert not isinstance(kwargs['data'], bytes)
+            return post(**kwargs)
+
+        def upload(request):
+            assert request.headers['Content-Length'] == str(
+                zip_file.stat().st_size)
+            bodies.append(request.body)
+            return 200, {}, '{"uploadId": "id1"}'
+
+        responses.add_callback(
+            method=responses.POST,
+            url='%s/%s/upload' % (client.url, wrapper_id),
+            callback=upload,
+        )
+        client._session.post = spy_post
+
+        assert client._stage_file(zip_file, wrapper_id) == 'id1'
+        assert bodies == [zip_file.read_bytes()]
+
+    @responses.activate
+    def test_largest_files_first(self, csv_file, zip_file):
+        client = DatasetClient(url='http://localhost', token='',
+                               max_workers=1)
+        sizes = []
+
+        def upload(request):
+            sizes.append(len(request.body))
+            return 200, {}, '{"uploadId": "id%i"}' % len(sizes)
+
+        responses.add_callback(
+            method=responses.POST,
+            url='%s/wrapper_id/upload' % client.url,
+            callback=upload,
+        )
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            uploads = client._stage_files(
+                [csv_file, zip_file], 'wrapper_id', pool)
+            assert sorted(future.result() for future in uploads) == [
+                'id1', 'id2']
+
+        assert list(uploads.values()) == [zip_file, csv_file]
+        assert sizes == [zip_file.stat().st_size, csv_file.stat().st_size]
+
+    @responses.activate
+    def test_bandwidth_cap(self, client, zip_file):
+        sleeps = []
+        client._bandwidth = TokenBucket(
+            100, clock=lambda: 0.0, sleep=sleeps.append)
+        responses.add(
+            method=responses.POST,
+            url='%s/wrapper_id/upload' % client.url,
+            json={'uploadId': 'id1'},
+        )
+
+        client._stage_file(zip_file, 'wrapper_id')
+        size = zip_file.stat().st_size
+        assert sum(sleeps) == pytest.approx((size - 100) / 100)
+
+    @responses.activate
+    def test_compressed_upload(self, csv_file, zip_file):
+        client = DatasetClient(url='http://localhost', token='',
+                               compress_level=6)
+        csv_file.write_text('a,b\n' + '1,2\n' * 10000)
+        uploads = dict()
+
+        def upload(request):
+            body = request.body
+            if not isinstance(body, bytes):
+                # Compressed bodies are generators, sent chunked
+                assert request.headers['Transfer-Encoding'] == 'chunked'
+                body = b''.join(body)
+            uploads[request.headers['Content-Type']] = (
+                request.headers.get('Content-Encoding'), body)
+            return 200, {}, '{"uploadId": "id1"}'
+
+        responses.add_callback(
+            method=responses.POST,
+            url='%s/wrapper_id/upload' % client.url,
+            callback=upload,
+        )
+        client._stage_file(csv_file, 'wrapper_id')
+        client._stage_file(zip_file, 'wrapper_id')
+
+        encoding, body = uploads['text/csv']
+        assert encoding == 'gzip'
+        assert len(body) < csv_file.stat().st_size / 10
+        assert gzip.decompress(body) == csv_file.read_bytes()
+        assert uploads['application/zip'] == (None, zip_file.read_bytes())
+
+    def test_invalid_compress_level(self):
+        with pytest.raises(ValueError):
+            DatasetClient(url='http://localhost', token='', compress_level=10)
+
+
+class TestStatusTracking:
+    wrapper_id = 'wrapper_id'
+
+    def add_server(self, client, statuses, upload):
+        base = '%s/%s' % (client.url, self.wrapper_id)
+
+        def status(request):
+            return 200, {}, json.dumps({'uploadStatuses': statuses()})
+
+        responses.add(
+            method=responses.POST,
+            url=client.url,
+            json={'datasetWrapperId': self.wrapper_id}
+        )
+        responses.add_callback(
+            method=responses.POST, url='%s/upload' % base, callback=upload)
+        responses.add_callback(
+            method=responses.GET, url='%s/uploads' % base, callback=status)
+        responses.add(
+            method=responses.POST,
+            url='%s/upload_complete' % base,
+            status=204,
+        )
+
+    @responses.activate
+    def test_polling_overlaps_staging(self, client, csv_file, zip_file):
+        saved = threading.Event()
+
+        def upload(request):
+            if request.body == b'mock':
+                return 200, {}, '{"uploadId": "csv"}'
+            # The zip is only staged once the csv is reported as saved
+            assert saved.wait(5)
+            return 200, {}, '{"uploadId": "zip"}'
+
+        def statuses():
+            saved.set()
+            return [
+                {'uploadId': 'csv', 'status': 'SUCCESS'},
+                {'uploadId': 'zip', 'status': 'SUCCESS'},
+            ]
+
+        self.add_server(client, statuses, upload)
+        client.upload_data([csv_file, zip_file], progress=False)
+        assert responses.calls[-1].request.url.endswith('/upload_complete')
+
+    @responses.activate
+    def test_fails_fast(self, client, csv_file, zip_file):
+        released = threading.Event()
+
+        def upload(request):
+            if request.body == b'mock':
+                return 200, {}, '{"uploadId": "csv"}'
+            released.wait(5)
+            return 200, {}, '{"uploadId": "zip"}'
+
+        def statuses():
+            return [{'uploadId': 'csv', 'status': 'FAILED', 'message': 'x'}]
+
+        self.add_server(client, statuses, upload)
+        try:
+            with pytest.raises(IOError):
+                client.upload_data([csv_file, zip_file], progress=False)
+        finally:
+            released.set()
+
+    @responses.activate
+    def test_adaptive_poll_interval(self, client, csv_file, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(
+            'sidekick.dataset_client.time.sleep', sleeps.append)
+        polled = []
+
+        def upload(request):
+            return 200, {}, '{"uploadId": "csv"}'
+
+        def statuses():
+            polled.append(None)
+            status = 'SUCCESS' if len(polled) > 3 else 'PROCESSING'
+            return [{'uploadId': 'csv', 'status': status}]
+
+        self.add_server(client, statuses, upload)
+        client.upload_data([csv_file], progress=False)
+
+        assert len(sleeps) == 4
+        for before, after in zip(sleeps, sleeps[1:]):
+            assert after > before * 1.5
+
+    @responses.activate
+    def test_manifest_skips_uploaded_files(
+            self, client, csv_file, zip_file, tmp_path):
+        state_path = str(tmp_path / 'state.json')
+        manifest_path = tmp_path / 'manifest.json'
+        uploaded = []
+        saved = {'csv1': 'SUCCESS', 'zip1': 'FAILED', 'zip2': 'SUCCESS'}
+
+        def upload(request):
+            kind = 'csv' if request.body == b'mock' else 'zip'
+            uploaded.append(kind)
+            return 200, {}, json.dumps(
+                {'uploadId': '%s%i' % (kind, uploaded.count(kind))})
+
+        def statuses():
+            return [
+                {'uploadId': upload_id, 'status': status, 'message': 'x'}
+                for upload_id, status in saved.items()
+            ]
+
+        self.add_server(client, statuses, upload)
+        with pytest.raises(IOError):
+            client.upload_data([csv_file, zip_file], progress=False,
+                               state_path=state_path,
+                               manifest_path=str(manifest_path))
+
+        assert sorted(uploaded) == ['csv', 'zip']
+        client.upload_data([csv_file, zip_file], progress=False,
+                           state_path=state_path,
+                           manifest_path=str(manifest_path))
+
+        # Only the file which failed to save is uploaded again
+        assert sorted(uploaded) == ['csv', 'zip', 'zip']
+        manifest = json.loads(manifest_path.read_text())
+        uploads = manifest['wrappers'][self.wrapper_id].values()
+        assert sorted((upload['uploadId'], upload['status'])
+                      for upload in uploads) == [
+            ('csv1', 'SUCCESS'), ('zip2', 'SUCCESS')]
+
+    def test_manifest_requires_state(self, client, csv_file, tmp_path):
+        with pytest.raises(ValueError):
+            client.upload_data([csv_file], progress=False,
+                               manifest_path=str(tmp_path / 'manifest.json'))
+        assert not (tmp_path / 'manifest.json').exists()
+
+    @responses.activate
+    def test_build_and_upload(self, client, tmp_path):
+        shard_dir = tmp_path / 'nested' / 'shards'
+        uploaded = []
+
+        def upload(request):
+            with ZipFile(io.BytesIO(request.body)) as zipfile:
+                index = zipfile.read('index.csv').decode()
+            uploaded.append(index.split()[1:])
+            return 200, {}, json.dumps({'uploadId': str(len(uploaded))})
+
+        def statuses():
+            return [
+                {'uploadId': str(number), 'status': 'SUCCESS'}
+                for number in range(1, len(uploaded) + 1)
+            ]
+
+        self.add_server(client, statuses, upload)
+        dataset_index = pd.DataFrame({'value': range(5)})
+        client.build_and_upload(
+            dataset_index, str(shard_dir), shard_size=2, progress=False,
+            parallel_processing=0)
+
+        assert sorted(uploaded) == [['0', '1'], ['2', '3'], ['4']]
+        assert list(shard_dir.iterdir()) == []
+        assert responses.calls[-1].request.url.endswith('/upload_complete')
+
+
+def test_manifest_caches_hashes(tmp_path, csv_file, monkeypatch):
+    hashed = []
+    monkeypatch.setattr('sidekick.manifest.file_sha256',
+                        lambda path: hashed.append(path) or 'digest')
+    manifest = UploadManifest(tmp_path / 'manifest.json')
+
+    assert manifest.file_hash(csv_file) == 'digest'
+    assert UploadManifest(tmp_path / 'manifest.json').file_hash(
+        csv_file) == 'digest'
+    assert hashed == [csv_file]
+
+    manifest.record('wrapper', 'digest', csv_file, 'id1', 'PROCESSING')
+    manifest.set_statuses('wrapper', {'id1': 'SUCCESS'})
+    assert manifest.find('wrapper', 'digest')['status'] == 'SUCCESS'
+    assert manifest.find('other', 'digest') is None
+
+
+def test_part_ranges():
+    assert part_ranges(10, 4) == [(1, 0, 4), (2, 4, 4), (3, 8, 2)]
+    assert part_ranges(8, 4) == [(1, 0, 4), (2, 4, 4)]
+    assert part_ranges(0, 4) == [(1, 0, 0)]
+    with pytest.raises(ValueError):
+        part_ranges(10, 0)
+
+
+class TestMultipartUpload:
+    wrapper_id = 'wrapper_id'
+    upload_id = 'multipart_id'
+
+    @pytest.fixture
+    def large_file(self, tmp_path):
+        filepath = tmp_path / 'large.zip'
+        filepath.write_bytes(b'0123456789')
+        return filepath
+
+    def add_server(self, client, parts, fail_parts=(), etag=None,
+                   singles=None, fail_after=None):
+        base = '%s/%s' % (client.url, self.wrapper_id)
+        multipart = '%s/multipart_uploads' % base
+
+        def upload_part(request):
+            number = int(request.url.rsplit('/', 1)[1])
+            if number in fail_parts:
+                if fail_after is not None:
+                    assert fail_after.wait(5)
+                return 500, {}, ''
+            parts[number] = request.body
+            checksum = etag or hashlib.md5(request.body).hexdigest()
+            return 200, {'ETag': '"%s"' % checksum}, ''
+
+        responses.add(
+            method=responses.POST,
+            url=client.url,
+            json={'datasetWrapperId': self.wrapper_id}
+        )
+        responses.add(
+            method=responses.POST,
+            url=multipart,
+            json={'uploadId': self.upload_id},
+        )
+        responses.add_callback(
+            method=responses.PUT,
+            url=re.compile('%s/%s/parts/\\d+' % (multipart, self.upload_id)),
+            callback=upload_part,
+        )
+        responses.add(
+            method=responses.POST,
+            url='%s/%s/complete' % (multipart, self.upload_id),
+            json={'uploadId': self.upload_id},
+        )
+        if singles is not None:
+
+            def upload(request):
+                singles.append(request.body)
+                if fail_after is not None:
+                    fail_after.set()
+                return 200, {}, json.dumps({'uploadId': 'single'})
+
+            responses.add_callback(
+                method=responses.POST,
+                url='%s/upload' % base,
+                callback=upload,
+            )
+        responses.add(
+            method=responses.GET,
+            url='%s/uploads' % base,
+            json={'uploadStatuses': [
+                {'uploadId': self.upload_id, 'status': 'SUCCESS'},
+                {'uploadId': 'single', 'status': 'SUCCESS'},
+            ]},
+        )
+        responses.add(
+            method=responses.POST,
+            url='%s/upload_complete' % base,
+            status=204,
+        )
+
+    @responses.activate
+    def test_resumes_missing_parts(self, large_file, tmp_path):
+        client = DatasetClient(
+            url='http://localhost', token='', part_size=4, part_workers=1)
+        state_path = tmp_path / 'upload.json'
+        parts = {}  # type: dict
+        self.add_server(client, parts, fail_parts=[2])
+
+        with pytest.raises(requests.HTTPError):
+            client.upload_data([large_file], state_path=str(state_path),
+                               progress=False)
+        state = json.loads(state_path.read_text())
+        assert state['wrapperId'] == self.wrapper_id
+        assert set(state['files'][str(large_file)]['parts']) == {'1', '3'}
+
+        responses.reset()
+        parts.clear()
+        self.add_server(client, parts)
+        client.upload_data([large_file], state_path=str(state_path),
+                           progress=False)
+
+        assert parts == {2: b'4567'}
+        calls = [(call.request.method, call.request.url)
+                 for call in responses.calls]
+        # Neither the dataset nor the multipart upload are created again
+        assert ('POST', client.url + '/') not in calls
+        complete = json.loads(responses.calls[1].request.body)
+        assert complete['parts'] == [
+            {'partNumber': number,
+             'etag': hashlib.md5(data).hexdigest()}
+            for number, data in enumerate([b'0123', b'4567', b'89'], 1)
+        ]
+        assert not state_path.exists()
+
+    @responses.activate
+    def test_resume_skips_single_uploads(self, large_file, csv_file,
+                                         tmp_path):
+        client = DatasetClient(
+            url='http://localhost', token='', part_size=4, part_workers=1)
+        state_path = tmp_path / 'upload.json'
+        singles = []  # type: list
+        # The multipart upload fails once the small file is uploaded
+        self.add_server(client, {}, fail_parts=[2], singles=singles,
+                        fail_after=threading.Event())
+
+        with pytest.raises(requests.HTTPError):
+            client.upload_data([large_file, csv_file],
+                               state_path=str(state_path), progress=False)
+        state = json.loads(state_path.read_text())
+        assert state['files'][str(csv_file)]['uploadId'] == 'single'
+        assert state['files'][str(csv_file)]['completed']
+
+        responses.reset()
+        self.add_server(client, {}, singles=singles)
+        stats = client.upload_data([large_file, csv_file],
+                                   state_path=str(state_path),
+                                   progress=False)
+
+        assert singles == [b'mock']
+        assert stats.done_bytes == stats.total_bytes
+        assert not state_path.exists()
+
+    @responses.activate
+    def test_checksum_mismatch(self, large_file):
+        client = DatasetClient(url='http://localhost', token='', part_size=4)
+        self.add_server(client, {}, etag='mismatch')
+
+        with pytest.raises(IOError):
+            client.upload_data([large_file], progress=False)
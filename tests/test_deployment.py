@@ -1,55 +1,23 @@
+import base64
+import gzip
+import json
 import random
-from typing import List
+import threading
+import time
 
 import numpy as np
 import pytest
+import requests
 import responses
+from mock_specs import mock_api_specs
 from PIL import Image
 
 import sidekick
 from sidekick import Deployment
 from sidekick.data_models import FeatureSpec
-
-
-def get_feature(dtype: str, shape: List[int]):
-    return {
-        'extensions': {
-            'x-peltarion': {
-                'type': dtype,
-                'shape': shape,
-            },
-        },
-    }
-
-
-def get_properties(features: List[FeatureSpec]) -> dict:
-    return {
-        feature.name: get_feature(feature.dtype, feature.shape)
-        for feature in features
-    }
-
-
-def mock_api_specs(
-    features_in: List[FeatureSpec],
-    features_out: List[FeatureSpec],
-) -> dict:
-
-    return {
-        'components': {
-            'schemas': {
-                'input-row': {
-                    'properties': get_properties(features_in)
-                },
-                'output-row-batch': {
-                    'properties': {
-                        'rows': {
-                            'properties': get_properties(features_out)
-                        },
-                    },
-                },
-            },
-        },
-    }
+from sidekick.deployment import (PredictionError, iter_request_body,
+                                 serialize_request)
+from sidekick.encode import LazyItem
 
 
 @responses.activate
@@ -341,3 +309,356 @@ def test_deployment_user_agent():
     assert predictions == {'output': prediction}
     assert len(responses.calls) == 2
     assert 'sidekick' in request.headers['User-Agent'].lower()
+
+
+def add_resilient_deployment(mock_deployment, statuses: list) -> None:
+    """Mock deployment rejecting batches with negative inputs
+
+    Responds with the statuses in `statuses` first, if any.
+    """
+    features_in = [FeatureSpec('input', 'numeric', (1,))]
+    features_out = [FeatureSpec('output', 'numeric', (1,))]
+
+    def forward(rows):
+        if statuses:
+            return statuses.pop(0), {}, ''
+        if any(row['input'] < 0 for row in rows):
+            return 400, {}, json.dumps({'errorMessage': 'Bad input'})
+        return [{'output': row['input'] * 2} for row in rows]
+
+    mock_deployment(features_in, features_out, forward)
+
+
+@responses.activate
+def test_deployment_resilient_isolates_bad_items(monkeypatch, mock_deployment):
+    monkeypatch.setattr(Deployment, 'BATCH_SIZE', 8)
+    add_resilient_deployment(mock_deployment, [])
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+    )
+    inputs = [{'input': i} for i in range(20)]
+    inputs[3] = {'input': -1}
+    inputs[17] = {'input': 'foo'}
+
+    with pytest.raises(requests.HTTPError):
+        deployment.predict_many(inputs)
+
+    predictions = deployment.predict_many(inputs, resilient=True)
+    assert len(predictions) == len(inputs)
+    for position, prediction in enumerate(predictions):
+        if position in (3, 17):
+            assert isinstance(prediction, PredictionError)
+            assert prediction.item is inputs[position]
+        else:
+            assert prediction == {'output': position * 2}
+    assert predictions[3].status_code == 400
+    assert predictions[17].status_code is None
+
+
+@responses.activate
+def test_deployment_resilient_retries(monkeypatch, mock_deployment):
+    sleeps = []  # type: list
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    statuses = [503, 429]
+    add_resilient_deployment(mock_deployment, statuses)
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+    )
+
+    predictions = deployment.predict_many([{'input': 1}], resilient=True)
+    assert predictions == [{'output': 2}]
+    assert len(sleeps) == 2
+    assert all(0 <= sleep <= Deployment.MAX_BACKOFF for sleep in sleeps)
+
+    # Exhausted retries fail every item of the batch without splitting
+    statuses.extend([503] * (Deployment.MAX_RETRIES + 1))
+    predictions = deployment.predict_many(
+        [{'input': 1}, {'input': 2}], resilient=True)
+    assert [p.status_code for p in predictions] == [503, 503]
+    assert not statuses
+
+
+@responses.activate
+def test_deployment_resilient_raises_request_errors(
+        monkeypatch, mock_deployment):
+    monkeypatch.setattr(Deployment, 'BATCH_SIZE', 8)
+    statuses = [401] * 10
+    add_resilient_deployment(mock_deployment, statuses)
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+    )
+
+    # No item can cause an authentication error, so batches are not split
+    with pytest.raises(requests.HTTPError):
+        deployment.predict_many([{'input': i} for i in range(8)],
+                                resilient=True)
+    assert len(statuses) == 9
+
+    # HTTP errors without a response fail the batch like connection errors
+    def raise_error(*args, **kwargs):
+        raise requests.HTTPError('No response')
+
+    monkeypatch.setattr(deployment, '_predict_encoded', raise_error)
+    predictions = deployment.predict_many([{'input': 1}, {'input': 2}],
+                                          resilient=True)
+    assert [p.status_code for p in predictions] == [None, None]
+    assert [p.item for p in predictions] == [{'input': 1}, {'input': 2}]
+
+
+@responses.activate
+def test_deployment_batch_hooks(monkeypatch, mock_deployment):
+    monkeypatch.setattr(Deployment, 'BATCH_SIZE', 8)
+    monkeypatch.setattr(time, 'sleep', lambda _: None)
+    add_resilient_deployment(mock_deployment, [503])
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+    )
+    timings = []  # type: list
+    deployment.add_batch_hook(timings.append)
+
+    deployment.predict_many([{'input': i} for i in range(20)], resilient=True)
+    assert [timing.batch_size for timing in timings] == [8, 8, 4]
+    assert [timing.retries for timing in timings] == [1, 0, 0]
+    for timing in timings:
+        assert timing.encode_time > 0
+        assert timing.request_bytes > 0
+        assert timing.response_bytes > 0
+        assert timing.request_time > 0
+        assert timing.total_time >= timing.request_time
+
+    assert len(deployment.latency) == 3
+    assert deployment.latency.p50 <= deployment.latency.p99
+
+    deployment.remove_batch_hook(timings.append)
+    deployment.predict(input=1)
+    assert len(timings) == 3
+    assert len(deployment.latency) == 4
+
+
+@responses.activate
+def test_deployment_lazy_decode(mock_deployment):
+    shape = (10, 10, 3)
+    features_in = [FeatureSpec('input', 'numeric', (1,))]
+    features_out = [
+        FeatureSpec('image', 'image', shape),
+        FeatureSpec('score', 'numeric', (1,)),
+    ]
+    image = Image.fromarray(np.uint8(np.random.rand(*shape) * 255))
+    image.format = 'png'
+    encoded = sidekick.encode.ImageEncoder().encode_json(image)
+
+    responses.add(
+        responses.POST,
+        'http://peltarion.com/deployment/forward',
+        json={'rows': [{'image': encoded, 'score': 0.5}] * 3}
+    )
+    mock_deployment(features_in, features_out)
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+    )
+
+    inputs = [{'input': i} for i in range(3)]
+    predictions = deployment.predict_many(inputs, lazy_decode=True)
+    assert all(isinstance(p, LazyItem) for p in predictions)
+    assert [p['score'] for p in predictions] == [0.5] * 3
+    np.testing.assert_array_equal(
+        np.array(predictions[0]['image']), np.array(image))
+    assert dict(predictions[1])['score'] == 0.5
+
+    predictions = deployment.predict_many(
+        inputs, resilient=True, lazy_decode=True)
+    assert all(isinstance(p, LazyItem) for p in predictions)
+
+
+@responses.activate
+def test_deployment_image_path_input(tmp_path, mock_deployment):
+    shape = (10, 10, 3)
+    features_in = [FeatureSpec('input', 'image', shape)]
+    features_out = [FeatureSpec('output', 'numeric', (1,))]
+    path = tmp_path / 'image.png'
+    Image.fromarray(np.uint8(np.random.rand(*shape) * 255)).save(str(path))
+
+    responses.add(
+        responses.POST,
+        'http://peltarion.com/deployment/forward',
+        json={'rows': [{'output': 1}]}
+    )
+    mock_deployment(features_in, features_out)
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+    )
+
+    assert deployment.predict(input=path) == {'output': 1}
+    sent = json.loads(responses.calls[-1].request.body)['rows'][0]['input']
+    assert sent == 'data:image/png;base64,%s' % (
+        base64.b64encode(path.read_bytes()).decode())
+
+
+def test_iter_request_body(tmp_path):
+    path = tmp_path / 'array.npy'
+    np.save(str(path), np.random.rand(50).astype(np.float32))
+    encoder = sidekick.encode.NumpyEncoder()
+    encoded = {'rows': [
+        {
+            'array': encoder.source_payload(path, (50,)),
+            'bytes': encoder.payload(np.random.rand(20)),
+            'text': 'a "quoted" text',
+            'number': 1.5,
+        },
+        {'array': encoder.source_payload(path.read_bytes(), (50,))},
+    ]}
+    expected = {'rows': [
+        {name: value.to_json() if hasattr(value, 'to_json') else value
+         for name, value in row.items()}
+        for row in encoded['rows']
+    ]}
+
+    assert json.loads(serialize_request(encoded).decode()) == expected
+    for chunk_size in (1, 7, 100, 2 ** 16):
+        chunks = list(iter_request_body(encoded, chunk_size))
+        assert json.loads(b''.join(chunks).decode()) == expected
+        assert all(len(chunk) < chunk_size + 100 for chunk in chunks)
+
+
+@responses.activate
+def test_deployment_stream_requests(tmp_path, mock_deployment):
+    shape = (10, 10, 3)
+    features_in = [
+        FeatureSpec('image', 'image', shape),
+        FeatureSpec('number', 'numeric', (1,)),
+    ]
+    features_out = [FeatureSpec('output', 'text', (1,))]
+    path = tmp_path / 'image.png'
+    image = Image.fromarray(np.uint8(np.random.rand(*shape) * 255))
+    image.save(str(path))
+    image.format = 'png'
+    bodies = []  # type: list
+
+    def forward(request):
+        assert not isinstance(request.body, bytes)
+        bodies.append(json.loads(b''.join(request.body).decode()))
+        rows = bodies[-1]['rows']
+        return 200, {}, json.dumps({'rows': [
+            {'output': row['image'][:22]} for row in rows
+        ]})
+
+    mock_deployment(features_in, features_out)
+    responses.add_callback(
+        responses.POST,
+        'http://peltarion.com/deployment/forward',
+        callback=forward,
+    )
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+        stream_requests=True,
+    )
+    timings = []  # type: list
+    deployment.add_batch_hook(timings.append)
+
+    predictions = deployment.predict_many([
+        {'image': path, 'number': 1},
+        {'image': image, 'number': 2},
+    ])
+    assert predictions == [{'output': 'data:image/png;base64,'}] * 2
+    sent = bodies[0]['rows']
+    assert sent[0]['image'] == 'data:image/png;base64,%s' % (
+        base64.b64encode(path.read_bytes()).decode())
+    assert [row['number'] for row in sent] == [1, 2]
+    assert timings[0].request_bytes == len(json.dumps(bodies[0]))
+
+
+@responses.activate
+@pytest.mark.parametrize('stream_requests', [False, True])
+def test_deployment_compress_requests(stream_requests, mock_deployment):
+    features_in = [FeatureSpec('text', 'text', (1,))]
+    features_out = [FeatureSpec('output', 'text', (1,))]
+    bodies = []  # type: list
+
+    def forward(request):
+        assert request.headers['Content-Encoding'] == 'gzip'
+        assert 'gzip' in request.headers['Accept-Encoding']
+        body = request.body
+        if not isinstance(body, bytes):
+            body = b''.join(body)
+        bodies.append(body)
+        rows = json.loads(gzip.decompress(body).decode())['rows']
+        response = json.dumps({'rows': [
+            {'output': row['text'].upper()} for row in rows
+        ]}).encode()
+        return 200, {'Content-Encoding': 'gzip'}, gzip.compress(response)
+
+    mock_deployment(features_in, features_out)
+    responses.add_callback(
+        responses.POST,
+        'http://peltarion.com/deployment/forward',
+        callback=forward,
+    )
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+        stream_requests=stream_requests,
+        compress_level=6,
+    )
+    timings = []  # type: list
+    deployment.add_batch_hook(timings.append)
+
+    items = [{'text': 'sample %i' % i} for i in range(100)]
+    predictions = deployment.predict_many(items)
+    assert predictions == [
+        {'output': item['text'].upper()} for item in items
+    ]
+    assert timings[0].request_bytes == len(bodies[0])
+
+
+def test_deployment_compress_level_validation():
+    with pytest.raises(ValueError):
+        Deployment(
+            url='http://peltarion.com/deployment/forward',
+            token='deployment_token',
+            lazy=True,
+            compress_level=10,
+        )
+
+
+@responses.activate
+def test_deployment_predict_unordered(monkeypatch, mock_deployment):
+    monkeypatch.setattr(Deployment, 'BATCH_SIZE', 2)
+    features = [FeatureSpec('number', 'numeric', (1,))]
+    released = threading.Event()
+
+    def forward(rows):
+        if rows[0]['number'] == 0:
+            # Hold back the first batch until a later one has been yielded
+            assert released.wait(5)
+        return [{'number': row['number'] * 2} for row in rows]
+
+    mock_deployment(features, features, forward)
+    deployment = Deployment(
+        url='http://peltarion.com/deployment/forward',
+        token='deployment_token',
+    )
+
+    results = deployment.predict_unordered(
+        [{'number': number} for number in range(6)], max_in_flight=3)
+    first = next(results)
+    released.set()
+    results = [first] + list(results)
+
+    assert first[0] >= 2
+    assert sorted(results) == [
+        (number, {'number': number * 2}) for number in range(6)
+    ]
+
+
+def test_feature_spec_equality():
+    spec = FeatureSpec('a', 'numeric', (1,))
+    assert spec == FeatureSpec('a', 'numeric', [1])
+    assert spec != FeatureSpec('a', 'numeric', (2,))
+    assert {spec, FeatureSpec('a', 'numeric', [1])} == {spec}
@@ -1,10 +1,15 @@
+import base64
+import io
+
 import numpy as np
 import pytest
 from PIL import Image
 
-from sidekick.encode import (ENCODERS, CategoricalEncoder, ImageEncoder,
-                             NumericEncoder, NumpyEncoder, TextEncoder,
-                             get_encoder)
+from sidekick.data_models import FeatureSpec
+from sidekick.encode import (ENCODERS, CategoricalEncoder, EncodingPlan,
+                             FeaturePlan, ImageEncoder, NumericEncoder,
+                             NumpyEncoder, TextEncoder, encode_feature,
+                             get_encoder, sniff_media_type)
 
 
 def test_numeric_encoder():
@@ -82,3 +87,146 @@ def test_get_encoder():
     assert get_encoder(dtype='numeric', shape=(2,)) is ENCODERS['numpy']
     assert get_encoder(dtype='numeric', shape=(2, 2)) is ENCODERS['numpy']
     assert get_encoder(dtype='image', shape=(2, 3)) is ENCODERS['image']
+
+
+def test_check_shapes():
+    NumpyEncoder().check_shapes([np.zeros((2, 3))] * 3, (2, 3))
+    with pytest.raises(ValueError):
+        NumpyEncoder().check_shapes([np.zeros((2, 3)), np.zeros(3)], (2, 3))
+
+    CategoricalEncoder().check_shapes([{'a': 1}, {'b': 2}], (1,))
+    with pytest.raises(ValueError):
+        CategoricalEncoder().check_shapes([{'a': 1}, {}], (1,))
+
+
+def test_feature_plan():
+    plan = FeaturePlan(FeatureSpec('input', 'numeric', (1,)))
+    assert plan.encoder is ENCODERS['numeric']
+    assert plan.encode_many([1, 2.5]) == [1, 2.5]
+    with pytest.raises(TypeError):
+        plan.encode_many([1, 'foo'])
+
+    plan = FeaturePlan(FeatureSpec('input', 'numeric', (2, 3)))
+    arrays = [np.random.rand(2, 3).astype(np.float32) for _ in range(3)]
+    decoded = plan.decode_many(plan.encode_many(arrays))
+    for array, value in zip(arrays, decoded):
+        np.testing.assert_array_equal(array, value)
+    with pytest.raises(ValueError):
+        plan.encode_many([np.zeros((3, 2))])
+
+
+def test_encoding_plan_matches_encode_feature():
+    specs = [
+        FeatureSpec('number', 'numeric', (1,)),
+        FeatureSpec('text', 'text', (10,)),
+        FeatureSpec('array', 'numeric', (3,)),
+    ]
+    items = [
+        {'number': i, 'text': str(i), 'array': np.random.rand(3)}
+        for i in range(5)
+    ]
+    plan = EncodingPlan(specs)
+    rows = plan.encode_rows(items)
+    assert rows == [
+        {spec.name: encode_feature(item[spec.name], spec) for spec in specs}
+        for item in items
+    ]
+    decoded = plan.decode_rows(rows)
+    assert [item['text'] for item in decoded] == [str(i) for i in range(5)]
+
+    with pytest.raises(ValueError):
+        plan.encode_rows([{'number': 1, 'text': 'a'}])
+    with pytest.raises(ValueError):
+        plan.decode_rows([{'number': 1}])
+
+
+def test_lazy_rows_decode_on_access(monkeypatch):
+    specs = [
+        FeatureSpec('array', 'numeric', (3,)),
+        FeatureSpec('number', 'numeric', (1,)),
+    ]
+    plan = EncodingPlan(specs)
+    array = np.random.rand(3).astype(np.float32)
+    rows = plan.encode_rows([{'array': array, 'number': 1}] * 2)
+
+    decoded = []  # type: list
+    decode = NumpyEncoder.decode
+
+    def counting_decode(self, encoded):
+        decoded.append(encoded)
+        return decode(self, encoded)
+
+    monkeypatch.setattr(NumpyEncoder, 'decode', counting_decode)
+    items = plan.lazy_rows(rows)
+    assert len(items) == 2
+    assert items[0]['number'] == 1
+    assert decoded == []
+
+    np.testing.assert_array_equal(items[0]['array'], array)
+    assert items[0]['array'] is items[0]['array']
+    assert len(decoded) == 1
+
+    assert list(items[1]) == ['array', 'number']
+    assert len(items[1]) == 2
+    with pytest.raises(KeyError):
+        items[1]['missing']
+
+    with pytest.raises(ValueError):
+        plan.lazy_rows([{'number': 1}])
+
+
+def test_sniff_media_type():
+    assert sniff_media_type(b'\x89PNG\r\n\x1a\n...') == 'image/png'
+    assert sniff_media_type(b'\xff\xd8\xff\xe0...') == 'image/jpeg'
+    assert sniff_media_type(NumpyEncoder().encode(np.zeros(2))) == \
+        NumpyEncoder().media_type(None)
+    with pytest.raises(ValueError):
+        sniff_media_type(b'GIF89a')
+
+
+def test_image_source_passthrough(tmp_path):
+    image = Image.fromarray(np.uint8(np.random.rand(10, 10, 3) * 255))
+    path = tmp_path / 'image.jpeg'
+    image.save(str(path))
+    data = path.read_bytes()
+    expected = 'data:image/jpeg;base64,' + base64.b64encode(data).decode()
+
+    plan = FeaturePlan(FeatureSpec('image', 'image', (10, 10, 3)))
+    assert plan.encode_many([path, data]) == [expected, expected]
+
+    image.format = 'jpeg'
+    mixed = plan.encode_many([path, image])
+    assert mixed[0] == expected
+    assert mixed[1].startswith('data:image/jpeg;base64,')
+
+    # Numpy data is not an image
+    with pytest.raises(ValueError):
+        plan.encode_many([NumpyEncoder().encode(np.zeros(2))])
+
+    # Alpha channels are converted when encoding, so cannot be sent as is
+    rgba = Image.new(mode='RGBA', size=(10, 10))
+    with io.BytesIO() as buffer:
+        rgba.save(buffer, format='png')
+        with pytest.raises(ValueError):
+            plan.encode_many([buffer.getvalue()])
+
+    # Strings are not paths
+    with pytest.raises(TypeError):
+        plan.encode_many([str(path)])
+
+
+def test_numpy_source_passthrough(tmp_path):
+    array = np.random.rand(2, 3).astype(np.float32)
+    path = tmp_path / 'array.npy'
+    np.save(str(path), array)
+
+    plan = FeaturePlan(FeatureSpec('array', 'numeric', (2, 3)))
+    encoded = plan.encode_many([path])
+    np.testing.assert_array_equal(plan.decode_many(encoded)[0], array)
+
+    with pytest.raises(ValueError):
+        FeaturePlan(FeatureSpec('array', 'numeric', (3, 2))).encode_many(
+            [path])
+    with pytest.raises(ValueError):
+        plan.encode_many([NumpyEncoder().encode(array).replace(
+            b'<f4', b'<f8')])
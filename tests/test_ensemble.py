@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import responses
+from PIL import Image
+
+from sidekick import Deployment, DeploymentEnsemble
+from sidekick.data_models import FeatureSpec
+from sidekick.encode import ImageEncoder
+
+IMAGE = FeatureSpec('image', 'image', (4, 4, 3))
+NUMBER = FeatureSpec('number', 'numeric', (1,))
+
+
+def add_deployment(mock_deployment, name: str, features_in: list,
+                   bodies: dict) -> Deployment:
+    """Mock deployment recording the rows it receives in `bodies`"""
+    bodies[name] = []
+
+    def forward(rows):
+        bodies[name].append(rows)
+        return [{'output': '%s:%s' % (name, sorted(row))} for row in rows]
+
+    url = mock_deployment(
+        features_in, [FeatureSpec('output', 'text', (1,))], forward,
+        host='%s.peltarion.com' % name)
+    return Deployment(url=url, token='token')
+
+
+@responses.activate
+def test_ensemble_encodes_once(monkeypatch, mock_deployment):
+    monkeypatch.setattr(DeploymentEnsemble, 'BATCH_SIZE', 2)
+    bodies = {}  # type: dict
+    ensemble = DeploymentEnsemble({
+        'a': add_deployment(mock_deployment, 'a', [IMAGE, NUMBER], bodies),
+        'b': add_deployment(mock_deployment, 'b', [IMAGE], bodies),
+    })
+    assert ensemble.feature_specs_in == [IMAGE, NUMBER]
+
+    encodes = []  # type: list
+    encode = ImageEncoder.encode
+
+    def counting_encode(self, value):
+        encodes.append(value)
+        return encode(self, value)
+
+    monkeypatch.setattr(ImageEncoder, 'encode', counting_encode)
+    image = Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8))
+    image.format = 'png'
+    items = [{'image': image, 'number': number} for number in range(3)]
+
+    predictions = ensemble.predict_many(items)
+    assert len(encodes) == 3
+    assert predictions == [{
+        'a': {'output': "a:['image', 'number']"},
+        'b': {'output': "b:['image']"},
+    }] * 3
+    assert sorted(len(rows) for rows in bodies['a']) == [1, 2]
+    assert bodies['a'][0][0]['image'] == bodies['b'][0][0]['image']
+    assert ensemble.predict(**items[0])['b'] == {'output': "b:['image']"}
+
+
+@responses.activate
+def test_ensemble_spec_conflict(mock_deployment):
+    bodies = {}  # type: dict
+    deployments = {
+        'a': add_deployment(mock_deployment, 'a', [NUMBER], bodies),
+        'b': add_deployment(
+            mock_deployment, 'b', [FeatureSpec('number', 'numeric', (2,))],
+            bodies),
+    }
+    with pytest.raises(ValueError):
+        DeploymentEnsemble(deployments)
+    with pytest.raises(ValueError):
+        DeploymentEnsemble({})
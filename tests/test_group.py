@@ -0,0 +1,120 @@
+import pytest
+import requests
+import responses
+
+from sidekick import DeploymentGroup
+from sidekick.data_models import FeatureSpec
+from sidekick.group import _replica_error
+
+FEATURES_IN = [FeatureSpec('input', 'numeric', (1,))]
+FEATURES_OUT = [FeatureSpec('output', 'numeric', (1,))]
+
+
+def add_replica(mock_deployment, name: str, calls: dict, status: int = 200,
+                features_in=FEATURES_IN) -> str:
+    """Mock replica counting its calls in `calls` and returning its url"""
+    calls[name] = 0
+
+    def forward(rows):
+        calls[name] += 1
+        if status != 200:
+            return status, {}, ''
+        return [{'output': row['input'] * 2} for row in rows]
+
+    return mock_deployment(features_in, FEATURES_OUT, forward,
+                           host='%s.peltarion.com' % name)
+
+
+@responses.activate
+def test_group_predictions(monkeypatch, mock_deployment):
+    monkeypatch.setattr(DeploymentGroup, 'BATCH_SIZE', 4)
+    calls = {}  # type: dict
+    urls = [add_replica(mock_deployment, name, calls) for name in ('a', 'b')]
+    group = DeploymentGroup([(url, 'token') for url in urls])
+
+    assert group.feature_specs_in == FEATURES_IN
+    assert group.predict(input=3) == {'output': 6}
+
+    inputs = [{'input': i} for i in range(40)]
+    predictions = group.predict_many(inputs)
+    assert predictions == [{'output': i * 2} for i in range(40)]
+    assert sum(calls.values()) == 11
+
+    unordered = dict(group.predict_unordered(inputs))
+    assert unordered == dict(enumerate(predictions))
+
+
+@responses.activate
+def test_group_least_outstanding(mock_deployment):
+    calls = {}  # type: dict
+    urls = [add_replica(mock_deployment, name, calls)
+            for name in ('a', 'b', 'c')]
+    group = DeploymentGroup([(url, 'token') for url in urls])
+
+    acquired = [group._acquire() for _ in range(3)]
+    assert len(set(map(id, acquired))) == 3
+    group._release(acquired[1], failed=False)
+    assert group._acquire() is acquired[1]
+
+
+@responses.activate
+def test_group_ejects_failing_replica(mock_deployment):
+    calls = {}  # type: dict
+    good = add_replica(mock_deployment, 'good', calls)
+    bad = add_replica(mock_deployment, 'bad', calls, status=503)
+    group = DeploymentGroup([(good, 'token'), (bad, 'token')], max_failures=2)
+
+    for i in range(20):
+        assert group.predict(input=i) == {'output': i * 2}
+    assert calls['bad'] == 2
+    assert calls['good'] == 20
+
+
+@responses.activate
+def test_group_fails_over_rate_limited_replica(mock_deployment):
+    calls = {}  # type: dict
+    good = add_replica(mock_deployment, 'good', calls)
+    limited = add_replica(mock_deployment, 'limited', calls, status=429)
+    group = DeploymentGroup([(good, 'token'), (limited, 'token')],
+                            max_failures=2)
+
+    for i in range(20):
+        assert group.predict(input=i) == {'output': i * 2}
+    assert calls['limited'] == 2
+    assert calls['good'] == 20
+
+
+def test_replica_error():
+    response = requests.Response()
+    response.status_code = 400
+    assert not _replica_error(requests.HTTPError(response=response))
+    response.status_code = 503
+    assert _replica_error(requests.HTTPError(response=response))
+    # Errors without a response are not caused by the batch
+    assert _replica_error(requests.HTTPError('No response'))
+
+
+@responses.activate
+def test_group_client_errors_are_not_retried(mock_deployment):
+    calls = {}  # type: dict
+    urls = [add_replica(mock_deployment, name, calls, status=400)
+            for name in ('a', 'b')]
+    group = DeploymentGroup([(url, 'token') for url in urls])
+
+    with pytest.raises(requests.HTTPError):
+        group.predict(input=1)
+    assert sum(calls.values()) == 1
+
+
+@responses.activate
+def test_group_spec_mismatch(mock_deployment):
+    calls = {}  # type: dict
+    first = add_replica(mock_deployment, 'a', calls)
+    second = add_replica(
+        mock_deployment, 'b', calls,
+        features_in=[FeatureSpec('input', 'numeric', (2,))])
+
+    with pytest.raises(ValueError):
+        DeploymentGroup([(first, 'token'), (second, 'token')])
+    with pytest.raises(ValueError):
+        DeploymentGroup([])
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+
+import pytest
+
+import sidekick
+
+
+def imported_modules(statement):
+    code = 'import sys\n%s\nprint(" ".join(sys.modules))' % statement
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return set(output.decode().split())
+
+
+def test_deployment_does_not_import_heavy_modules():
+    modules = imported_modules(
+        'import sidekick\n'
+        'sidekick.Deployment\n'
+        'from sidekick import DeploymentGroup, RateLimiter'
+    )
+    assert 'sidekick.deployment' in modules
+    assert 'pandas' not in modules
+    assert 'pkg_resources' not in modules
+    assert 'tqdm' not in modules
+
+
+def test_dataset_client_does_not_import_deployment():
+    modules = imported_modules('from sidekick import DatasetClient')
+    assert 'sidekick.dataset_client' in modules
+    assert 'sidekick.deployment' not in modules
+    assert 'PIL' not in modules
+
+
+def test_lazy_attributes():
+    assert set(sidekick.__all__) <= set(dir(sidekick))
+    for name in sidekick.__all__:
+        assert getattr(sidekick, name) is not None
+    assert sidekick.encode.EncodingPlan is not None
+    assert isinstance(sidekick.__version__, str)
+    with pytest.raises(AttributeError):
+        sidekick.missing
@@ -0,0 +1,81 @@
+import math
+
+import pytest
+
+from sidekick.metrics import BatchTiming, LatencyHistogram, UploadStats
+
+
+def test_batch_timing():
+    timing = BatchTiming(batch_size=4)
+    timing.encode_time = 0.5
+    timing.request_time = 1.0
+    timing.parse_time = 0.25
+    timing.decode_time = 0.25
+    assert timing.total_time == 2.0
+    assert 'batch_size=4' in repr(timing)
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    assert math.isnan(histogram.p50)
+
+    for latency in range(1, 101):
+        histogram.add(latency)
+    assert len(histogram) == 100
+    assert histogram.p50 == 50
+    assert histogram.p95 == 95
+    assert histogram.p99 == 99
+    assert histogram.percentile(0) == 1
+    assert histogram.percentile(100) == 100
+
+    with pytest.raises(ValueError):
+        histogram.percentile(101)
+
+
+def test_latency_histogram_window():
+    histogram = LatencyHistogram(window=10)
+    for latency in range(100):
+        histogram.add(latency)
+    assert histogram.values() == list(range(90, 100))
+    assert histogram.p50 == 94
+
+
+def test_upload_stats():
+    now = [0.0]
+    notified = []
+    stats = UploadStats({'a': 100, 'b': 300}, [notified.append],
+                        interval=1.0, window=2.0, clock=lambda: now[0])
+    assert stats.eta is None
+
+    stats.skip('a', 100)
+    now[0] = 1.0
+    stats.add('b', 50)
+    now[0] = 2.0
+    stats.add('b', 50)
+    assert stats.done_bytes == 200
+    assert stats.sent_bytes == 100
+    assert stats.throughput == 50.0
+    assert stats.current_throughput == 50.0
+    assert stats.eta == 4.0
+    assert stats.files['b'].throughput(now[0]) == 100.0
+    assert stats.files['b'].current_throughput(now[0]) == 100.0
+    assert stats.files['b'].eta(now[0]) == 2.0
+    assert stats.files['a'].eta(now[0]) == 0.0
+
+    # Bytes older than the window no longer count as current
+    now[0] = 5.0
+    stats.add('b', 100)
+    assert stats.current_throughput == 50.0
+    assert stats.files['b'].current_throughput(now[0]) == 50.0
+    assert stats.files['b'].eta(now[0]) == 2.0
+    assert len(notified) == 4
+    # Callbacks are throttled to one per interval, and forced on close
+    now[0] = 5.5
+    stats.add('b', 50)
+    assert len(notified) == 4
+    stats.finish('b')
+    stats.close()
+    assert len(notified) == 5
+    assert stats.files['b'].elapsed(10.0) == 4.5
+    assert stats.files['b'].eta(10.0) == 0.0
+    assert 'done_bytes=350' in repr(stats)
@@ -0,0 +1,164 @@
+import collections
+
+import pytest
+import responses
+
+from sidekick import Deployment, RateLimiter
+from sidekick.data_models import FeatureSpec
+from sidekick.ratelimit import TokenBucket
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []  # type: list
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=5, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire(5) == 0
+    assert bucket.acquire(1) == pytest.approx(0.1)
+    clock.now += 10
+    # Refills up to the capacity only
+    assert bucket.acquire(5) == 0
+    assert bucket.acquire(20) == pytest.approx(2.0)
+
+    bucket.rate = 20
+    assert bucket.acquire(20) == pytest.approx(1.0)
+    # The capacity scales with the rate
+    clock.now += 10
+    assert bucket.acquire(10) == 0
+    clock.now += 10
+    bucket.rate = 5
+    assert bucket.acquire(10) == pytest.approx(1.5)
+
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_rate_limiter_adapts():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_second=10, items_per_second=100,
+                          increase=0.25, clock=clock, sleep=clock.sleep)
+
+    limiter.record(429)
+    assert limiter.fraction == 0.5
+    assert limiter.requests_per_second == 5
+    assert limiter.items_per_second == 50
+
+    limiter.record(500)
+    assert limiter.fraction == 0.5
+    limiter.record(200)
+    assert limiter.requests_per_second == 7.5
+
+    # Recovers to below the rate at the first of consecutive 429s
+    for _ in range(10):
+        limiter.record(429)
+    assert limiter.fraction == 0.05
+    for _ in range(10):
+        limiter.record(200)
+    assert limiter.fraction == pytest.approx(0.675)
+
+
+def test_rate_limiter_retry_after():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_second=10, clock=clock,
+                          sleep=clock.sleep)
+
+    assert limiter.acquire() == 0
+    limiter.record(429, retry_after=2.0)
+    assert limiter.acquire() == pytest.approx(2.0)
+
+    with pytest.raises(ValueError):
+        RateLimiter()
+
+
+class Quota:
+    """Server accepting `per_second` requests in any second"""
+
+    def __init__(self, clock: FakeClock, per_second: int) -> None:
+        self.clock = clock
+        self.per_second = per_second
+        self.accepted = collections.deque()  # type: collections.deque
+
+    def run(self, limiter: RateLimiter, requests: int) -> tuple:
+        """Sends requests, returns the number limited and the rate"""
+        started = self.clock.now
+        limited = 0
+        for _ in range(requests):
+            limiter.acquire()
+            while (self.accepted and
+                   self.accepted[0] <= self.clock.now - 1.0):
+                self.accepted.popleft()
+            if len(self.accepted) >= self.per_second:
+                limited += 1
+                limiter.record(429)
+            else:
+                self.accepted.append(self.clock.now)
+                limiter.record(200)
+        return limited, requests / (self.clock.now - started)
+
+
+def test_rate_limiter_settles_below_quota():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_second=100, clock=clock,
+                          sleep=clock.sleep)
+    quota = Quota(clock, 30)
+    quota.run(limiter, 3000)
+
+    # Only the periodic probes above the ceiling are rate limited
+    limited, rate = quota.run(limiter, 3000)
+    assert limited < 30
+    assert 25 < rate < 30
+
+
+def test_rate_limiter_recovers_with_quota():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_second=100, clock=clock,
+                          sleep=clock.sleep)
+    quota = Quota(clock, 30)
+    quota.run(limiter, 3000)
+    quota.per_second = 10
+    quota.run(limiter, 200)
+    assert limiter.requests_per_second < 10
+
+    quota.per_second = 30
+    quota.run(limiter, 20000)
+    limited, rate = quota.run(limiter, 3000)
+    assert limited < 30
+    assert 25 < rate < 30
+
+
+@responses.activate
+def test_deployment_rate_limiter(mock_deployment):
+    features = [FeatureSpec('number', 'numeric', (1,))]
+    statuses = [429, 200]
+
+    def forward(rows):
+        status = statuses.pop(0)
+        if status != 200:
+            return status, {'Retry-After': '0'}, ''
+        return rows
+
+    url = mock_deployment(features, features, forward)
+    clock = FakeClock()
+    limiter = RateLimiter(items_per_second=2, clock=clock, sleep=clock.sleep)
+    deployment = Deployment(
+        url=url, token='deployment_token', rate_limiter=limiter)
+
+    predictions = deployment.predict_many([{'number': 1}, {'number': 2}])
+    assert predictions == [{'number': 1}, {'number': 2}]
+    assert statuses == []
+    assert limiter.fraction == pytest.approx(0.52)
+    # The retried batch waits for the halved rate of 1 item per second
+    assert clock.sleeps == [pytest.approx(2.0)]
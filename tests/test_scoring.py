@@ -0,0 +1,167 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+import requests
+import responses
+from PIL import Image
+
+from sidekick import Deployment, score_file
+from sidekick.data_models import FeatureSpec
+from sidekick.scoring import read_rows
+
+URL = 'http://peltarion.com/deployment/forward'
+FEATURES_IN = [
+    FeatureSpec('id', 'text', (1,)),
+    FeatureSpec('number', 'numeric', (1,)),
+]
+FEATURES_OUT = [FeatureSpec('output', 'numeric', (1,))]
+
+
+def add_deployment(mock_deployment, calls: list, fail_on: int = -1) \
+        -> Deployment:
+    """Mock deployment recording its calls and rejecting `fail_on`"""
+
+    def forward(rows):
+        calls.append(rows)
+        if any(row['number'] == fail_on for row in rows):
+            return 400, {}, ''
+        return [{'output': row['number'] * 2} for row in rows]
+
+    url = mock_deployment(FEATURES_IN, FEATURES_OUT, forward)
+    return Deployment(url=url, token='deployment_token')
+
+
+def write_input(path, length: int) -> None:
+    with path.open('w') as file:
+        file.write('id,number\n')
+        for number in range(length):
+            file.write('%03i,%i\n' % (number, number))
+
+
+@responses.activate
+def test_score_csv_to_jsonl(tmp_path, monkeypatch, mock_deployment):
+    monkeypatch.setattr(Deployment, 'BATCH_SIZE', 4)
+    calls = []  # type: list
+    deployment = add_deployment(mock_deployment, calls)
+    write_input(tmp_path / 'input.csv', 10)
+
+    scored = score_file(deployment,
+                        tmp_path / 'input.csv',
+                        tmp_path / 'output.jsonl',
+                        keep_columns=['id'],
+                        max_in_flight=2,
+                        chunk_size=3)
+
+    assert scored == 10
+    # The last two batches are in flight at the same time
+    assert sorted(len(rows) for rows in calls) == [2, 4, 4]
+    rows = sorted((row for rows in calls for row in rows),
+                  key=lambda row: row['number'])
+    assert rows == [
+        {'id': '%03i' % number, 'number': number} for number in range(10)
+    ]
+    with (tmp_path / 'output.jsonl').open() as file:
+        lines = [json.loads(line) for line in file]
+    assert lines == [
+        {'id': '%03i' % number, 'output': number * 2}
+        for number in range(10)
+    ]
+    assert not (tmp_path / 'output.jsonl.checkpoint').exists()
+
+
+@responses.activate
+def test_score_resumes_from_checkpoint(
+        tmp_path, monkeypatch, mock_deployment):
+    monkeypatch.setattr(Deployment, 'BATCH_SIZE', 4)
+    calls = []  # type: list
+    deployment = add_deployment(mock_deployment, calls, fail_on=9)
+    write_input(tmp_path / 'input.csv', 10)
+    output = tmp_path / 'output.csv'
+
+    with pytest.raises(requests.HTTPError):
+        score_file(deployment, tmp_path / 'input.csv', output,
+                   keep_columns=['id'], max_in_flight=1)
+    checkpoint = json.loads(
+        (tmp_path / 'output.csv.checkpoint').read_text())
+    assert checkpoint['rows'] == 8
+    assert checkpoint['offset'] == output.stat().st_size
+
+    # Simulate a partially written batch which must be discarded
+    with output.open('a') as file:
+        file.write('008,')
+    calls.clear()
+    responses.reset()
+    deployment = add_deployment(mock_deployment, calls)
+    scored = score_file(deployment, tmp_path / 'input.csv', output,
+                        keep_columns=['id'], max_in_flight=1)
+
+    assert scored == 2
+    assert calls == [[{'id': '008', 'number': 8}, {'id': '009', 'number': 9}]]
+    with output.open() as file:
+        rows = list(csv.reader(file))
+    assert rows == [['id', 'output']] + [
+        ['%03i' % number, str(number * 2)] for number in range(10)
+    ]
+
+
+def test_read_rows_path_columns(tmp_path):
+    image = Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8))
+    image.save(str(tmp_path / 'image.png'))
+    (tmp_path / 'input.csv').write_text(
+        'image,label\nimage.png,a\n%s,b\n' % (tmp_path / 'image.png'))
+
+    rows = list(read_rows(tmp_path / 'input.csv', path_columns=['image'],
+                          skip_rows=1))
+    assert rows == [{'image': tmp_path / 'image.png', 'label': 'b'}]
+    assert rows[0]['image'].read_bytes()
+
+
+@responses.activate
+def test_score_blank_cells(tmp_path, mock_deployment):
+    calls = []  # type: list
+    deployment = add_deployment(mock_deployment, calls)
+    (tmp_path / 'input.csv').write_text(
+        'id,number,note\n,1,\n002,2,b\n')
+
+    score_file(deployment, tmp_path / 'input.csv', tmp_path / 'output.csv',
+               keep_columns=['note'])
+    assert calls == [[{'id': '', 'number': 1}, {'id': '002', 'number': 2}]]
+    with (tmp_path / 'output.csv').open() as file:
+        assert list(csv.reader(file)) == [
+            ['note', 'output'], ['', '2'], ['b', '4']]
+
+    (tmp_path / 'input.csv').write_text('id,number\n001,1\n002,\n')
+    with pytest.raises(ValueError, match='number in row 2'):
+        score_file(deployment, tmp_path / 'input.csv',
+                   tmp_path / 'output.jsonl')
+
+
+@responses.activate
+def test_score_keeps_columns_as_written(tmp_path, mock_deployment):
+    deployment = add_deployment(mock_deployment, [])
+    (tmp_path / 'input.csv').write_text(
+        'key,count,id,number\n007,1,a,1\n010,,b,2\n')
+
+    score_file(deployment, tmp_path / 'input.csv', tmp_path / 'output.jsonl',
+               keep_columns=['key', 'count', 'number'])
+    with (tmp_path / 'output.jsonl').open() as file:
+        lines = [json.loads(line) for line in file]
+    assert lines == [
+        {'key': '007', 'count': '1', 'number': 1, 'output': 2},
+        {'key': '010', 'count': '', 'number': 2, 'output': 4},
+    ]
+
+
+@responses.activate
+def test_score_rejects_categorical_inputs(tmp_path, mock_deployment):
+    mock_deployment(
+        [FeatureSpec('color', 'categorical', (3,))], FEATURES_OUT)
+    deployment = Deployment(url=URL, token='deployment_token')
+    (tmp_path / 'input.csv').write_text('color\nred\n')
+
+    with pytest.raises(ValueError, match='color'):
+        score_file(deployment, tmp_path / 'input.csv',
+                   tmp_path / 'output.jsonl')
+    assert not (tmp_path / 'output.jsonl').exists()
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+import responses
+
+from sidekick import Deployment, FileSpecCache, MemorySpecCache
+from sidekick.data_models import FeatureSpec
+from sidekick.spec_cache import DeploymentSpecs
+
+URL = 'http://peltarion.com/deployment/forward'
+SPECS_URL = 'http://peltarion.com/deployment/openapi.json'
+FEATURES_IN = [FeatureSpec('input', 'numeric', (1,))]
+FEATURES_OUT = [FeatureSpec('output', 'numeric', (1,))]
+
+
+@pytest.fixture(params=['memory', 'file'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return MemorySpecCache()
+    return FileSpecCache(str(tmp_path / 'specs'))
+
+
+def test_deployment_specs_serialization():
+    specs = DeploymentSpecs(FEATURES_IN, FEATURES_OUT, etag='"v1"')
+    restored = DeploymentSpecs.from_dict(specs.to_dict())
+    assert restored.etag == specs.etag
+    assert restored.fetched_at == specs.fetched_at
+    assert repr(restored.feature_specs_in) == repr(FEATURES_IN)
+    assert repr(restored.feature_specs_out) == repr(FEATURES_OUT)
+
+
+def test_cache_get_set(cache):
+    assert cache.get(SPECS_URL) is None
+    cache.set(SPECS_URL, DeploymentSpecs(FEATURES_IN, FEATURES_OUT, 'v1'))
+    cached = cache.get(SPECS_URL)
+    assert cached.etag == 'v1'
+    assert cached.feature_specs_in[0].shape == (1,)
+    assert cache.get('http://other') is None
+
+
+def test_cache_freshness():
+    specs = DeploymentSpecs(FEATURES_IN, FEATURES_OUT)
+    assert not MemorySpecCache().is_fresh(specs)
+    assert MemorySpecCache(max_age=60).is_fresh(specs)
+    stale = DeploymentSpecs(FEATURES_IN, FEATURES_OUT,
+                            fetched_at=time.time() - 120)
+    assert not MemorySpecCache(max_age=60).is_fresh(stale)
+    assert MemorySpecCache(max_age=60).is_fresh(stale.revalidated())
+
+
+def test_corrupt_file_cache_entry(tmp_path):
+    cache = FileSpecCache(str(tmp_path))
+    cache.set(SPECS_URL, DeploymentSpecs(FEATURES_IN, FEATURES_OUT))
+    for path in tmp_path.iterdir():
+        path.write_text('not json')
+    assert cache.get(SPECS_URL) is None
+
+
+@responses.activate
+def test_deployment_revalidates_with_etag(cache, mock_deployment):
+    mock_deployment(FEATURES_IN, FEATURES_OUT, headers={'ETag': '"v1"'})
+    deployment = Deployment(url=URL, token='token', spec_cache=cache)
+    assert 'If-None-Match' not in responses.calls[0].request.headers
+    assert cache.get(SPECS_URL).etag == '"v1"'
+
+    responses.replace(responses.GET, SPECS_URL, status=304)
+    deployment = Deployment(url=URL, token='token', spec_cache=cache)
+    assert responses.calls[1].request.headers['If-None-Match'] == '"v1"'
+    assert deployment.feature_specs_in[0].name == 'input'
+    assert deployment.feature_specs_out[0].name == 'output'
+
+
+@responses.activate
+def test_deployment_fresh_cache_skips_request():
+    cache = MemorySpecCache(max_age=60)
+    cache.set(SPECS_URL, DeploymentSpecs(FEATURES_IN, FEATURES_OUT))
+    deployment = Deployment(url=URL, token='token', spec_cache=cache)
+    assert deployment.feature_specs_in[0].name == 'input'
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+def test_lazy_deployment(mock_deployment):
+    mock_deployment(
+        FEATURES_IN, FEATURES_OUT, lambda rows: [{'output': 2}])
+
+    deployment = Deployment(url=URL, token='token', lazy=True)
+    assert len(responses.calls) == 0
+
+    assert deployment.predict(input=1) == {'output': 2}
+    assert deployment.predict(input=1) == {'output': 2}
+    assert [call.request.method for call in responses.calls] == [
+        'GET', 'POST', 'POST'
+    ]